@@ -1,8 +1,8 @@
 import streamlit as st
 import polars as pl
-from pathlib import Path
 import sqlite3
 import time
+import database
 
 def database_data():
     '''
@@ -12,11 +12,7 @@ def database_data():
     RETURN
         dataframe: dataframe degli utenti presenti nel database
     '''
-    db_dir = Path('DATABASE')
-    db = sqlite3.connect(db_dir/'user.db')
-    cursor = db.cursor()
-    cursor.execute("SELECT Mail, User_Type, Name_Surname  FROM USER")
-    rows = cursor.fetchall()
+    rows = database.query(database.SELECT_USERS_DATA)
     
     df = pl.DataFrame(
         data = rows,
@@ -65,19 +61,11 @@ def change_user_type(User_Type, Mail):
                  False se viene sollevata eccezzione
     '''
 
-    sql_update = '''UPDATE USER SET User_Type = ? WHERE Mail = ?'''
-    db_dir = Path('DATABASE')
-    db = sqlite3.connect(db_dir/'user.db')
-    cursor = db.cursor()
-
     try: 
-        cursor.execute(sql_update, (User_Type, Mail))
-        db.commit()
+        database.execute(database.UPDATE_USER_TYPE, (User_Type, Mail))
     except sqlite3.Error as e:
         st.error(f"Errore nel database: {e}")
         return False
-    finally:
-        db.close()
     return True
 
 def delete_user_by_email(email):
@@ -93,19 +81,11 @@ def delete_user_by_email(email):
                  False se viene sollevata eccezione
     '''
 
-    sql_delete = '''DELETE FROM USER WHERE Mail = ?'''
-    db_dir = Path('DATABASE')
-    db = sqlite3.connect(db_dir/'user.db')
-    cursor = db.cursor()
-
     try: 
-        cursor.execute(sql_delete, (email,))
-        db.commit()
+        database.execute(database.DELETE_USER, (email,))
     except sqlite3.Error as e:
         st.error(f"Errore nel database: {e}")
         return False
-    finally:
-        db.close()
     return True 
 
 def admin_main():
@@ -0,0 +1,380 @@
+import streamlit as st
+import polars as pl
+import dataset
+
+'''
+Aggregati precalcolati usati dai grafici della dashboard.
+Ogni aggregato è costruito una sola volta per versione del dataset, è condiviso tra
+tutte le sessioni (st.cache_resource) e viene aggiornato in modo incrementale
+quando vengono aggiunte nuove vendite.
+'''
+
+# Chiavi del cubo aggregato
+cube_keys = ['Make', 'Model', 'Model Year', 'Electric Vehicle Type', 'County']
+
+
+def _cube_measures(data):
+    '''
+    Funzione che calcola le misure del cubo per ogni combinazione delle chiavi.
+    Le misure su autonomia e prezzo considerano solo i valori maggiori di 0,
+    come fanno i grafici della dashboard
+
+    PARAM
+        dataframe: righe del dataset
+    RETURN
+        dataframe: cubo con le colonne di cube_keys e le misure
+    '''
+    electric_range = pl.col('Electric Range').filter(pl.col('Electric Range') > 0)
+    msrp = pl.col('Base MSRP').filter(pl.col('Base MSRP') > 0)
+    return (
+        data
+        .group_by(cube_keys)
+        .agg(
+            pl.len().alias('Count'),
+            electric_range.count().alias('Range Count'),
+            electric_range.sum().alias('Range Sum'),
+            electric_range.min().alias('Range Min'),
+            electric_range.max().alias('Range Max'),
+            msrp.count().alias('MSRP Count'),
+            msrp.sum().alias('MSRP Sum'),
+            msrp.min().alias('MSRP Min'),
+            msrp.max().alias('MSRP Max')
+        )
+    )
+
+
+class AggregateCube(dataset.IncrementalIndex):
+    '''
+    Cubo aggregato del dataset con chiavi (Make, Model, Model Year, Electric Vehicle Type, County)
+    e, per ogni combinazione, numero di auto e conteggio/somma/minimo/massimo di autonomia e prezzo.
+    Il cubo di ogni versione del dataset è salvato in DATA/derived e mappato in memoria,
+    quindi è condiviso da tutti i processi del server.
+    Le nuove vendite vengono aggregate e unite al cubo, senza rileggere tutto il dataset
+    '''
+
+    def load(self, signature):
+        self.cube = dataset.derived(
+            ['cube'],
+            signature,
+            lambda names: [_cube_measures(dataset.scan_data(signature)).collect()]
+        )['cube']
+
+    def build(self, data):
+        self.cube = _cube_measures(data)
+
+    def update(self, rows):
+        merged = pl.concat([self.cube, _cube_measures(rows)], how='vertical_relaxed')
+        self.cube = (
+            merged
+            .group_by(cube_keys)
+            .agg(
+                pl.col('Count', 'Range Count', 'Range Sum', 'MSRP Count', 'MSRP Sum').sum(),
+                pl.col('Range Min', 'MSRP Min').min(),
+                pl.col('Range Max', 'MSRP Max').max()
+            )
+            .select(self.cube.columns)
+        )
+
+    def data(self):
+        '''
+        Funzione che ritorna il cubo aggregato
+
+        RETURN
+            dataframe: cubo aggregato (sola lettura)
+        '''
+        with self.lock:
+            return self.cube
+
+
+@st.cache_resource(show_spinner=False)
+def _aggregate_cube():
+    return AggregateCube()
+
+
+def cube():
+    '''
+    Funzione che ritorna il cubo aggregato del dataset, condiviso tra le sessioni
+
+    RETURN
+        dataframe: cubo aggregato aggiornato all'ultima versione del dataset
+    '''
+    return _aggregate_cube().refresh().data()
+
+
+class RunningTotals(dataset.IncrementalIndex):
+    '''
+    Totali della dashboard mantenuti in modo incrementale: ogni nuova vendita aggiorna
+    i totali in tempo costante, senza ricalcolare nulla sul resto del dataset.
+    - numero di auto per anno, per produttore e per modello
+    - numero/somma/minimo/massimo dell'autonomia (> 0) per produttore
+    - numero di auto per produttore e valore dell'autonomia (> 0), e per produttore e tipologia del motore
+    - numero/somma dell'autonomia (> 0) per tipologia del motore
+    - numero/somma del prezzo (> 0) per tipologia del motore
+    - numero di auto per produttore, autonomia (> 0) e tipologia del motore (grafici dell'autonomia)
+    - numero/somma del prezzo (> 0) per anno, e numero di auto per autonomia (> 0), prezzo (> 0)
+      e tipologia del motore (grafici dei prezzi)
+    '''
+
+    @staticmethod
+    def _plans(data):
+        '''
+        PARAM
+            dataframe o lazyframe: righe del dataset
+        RETURN
+            dict: nome della tabella -> piano dei conteggi da cui vengono costruiti i totali
+        '''
+        electric_range = pl.col('Electric Range')
+        msrp = pl.col('Base MSRP')
+        data = data.lazy()
+        ranged = data.filter(electric_range > 0)
+        priced = data.filter(msrp > 0)
+        return {
+            'totals-year': data.group_by('Model Year').len(),
+            'totals-make': data.group_by('Make').len(),
+            'totals-model': data.group_by('Make', 'Model').len(),
+            'totals-make-range': ranged.group_by('Make').agg(
+                pl.len(),
+                electric_range.sum().alias('Sum'),
+                electric_range.min().alias('Min'),
+                electric_range.max().alias('Max')
+            ),
+            'totals-make-ranges': ranged.group_by('Make', 'Electric Range').len(),
+            'totals-make-type': ranged.group_by('Make', 'Electric Vehicle Type').len(),
+            'totals-type-range': ranged.group_by('Electric Vehicle Type').agg(pl.len(), electric_range.sum()),
+            'totals-type-msrp': priced.group_by('Electric Vehicle Type').agg(pl.len(), msrp.sum()),
+            'totals-range-type': ranged.group_by('Make', 'Electric Range', 'Electric Vehicle Type').len(),
+            'totals-year-msrp': priced.group_by('Model Year').agg(pl.len(), msrp.sum()),
+            'totals-range-msrp': (
+                priced
+                .filter(electric_range > 0)
+                .group_by('Electric Range', 'Base MSRP', 'Electric Vehicle Type')
+                .len()
+            )
+        }
+
+    def load(self, signature):
+        # i conteggi sono piccole tabelle salvate in DATA/derived: vengono calcolati da un solo
+        # processo sul LazyFrame del dataset, gli altri processi li leggono dai file
+        plans = self._plans(dataset.scan_data(signature))
+        tables = dataset.derived(
+            list(plans),
+            signature,
+            lambda names: pl.collect_all([plans[name] for name in names])
+        )
+        self._set(*tables.values())
+
+    def build(self, data):
+        self._set(*pl.collect_all(list(self._plans(data).values())))
+
+    def _set(self, year_count, make_count, model_count, make_range,
+             make_ranges, make_types, type_range, type_msrp,
+             range_types, year_msrp, range_msrp):
+        self.year_count = dict(year_count.iter_rows())
+        self.make_count = dict(make_count.iter_rows())
+        self.model_count = {}
+        for make, model, count in model_count.iter_rows():
+            self.model_count.setdefault(make, {})[model] = count
+        self.make_range = {row[0]: list(row[1:]) for row in make_range.iter_rows()}
+        self.make_ranges = {}
+        for make, value, count in make_ranges.iter_rows():
+            self.make_ranges.setdefault(make, {})[value] = count
+        self.make_types = {}
+        for make, engine_type, count in make_types.iter_rows():
+            self.make_types.setdefault(make, {})[engine_type] = count
+        self.type_range = {row[0]: list(row[1:]) for row in type_range.iter_rows()}
+        self.type_msrp = {row[0]: list(row[1:]) for row in type_msrp.iter_rows()}
+        self.range_types = {row[:-1]: row[-1] for row in range_types.iter_rows()}
+        self.year_msrp = {row[0]: list(row[1:]) for row in year_msrp.iter_rows()}
+        self.range_msrp = {row[:-1]: row[-1] for row in range_msrp.iter_rows()}
+        self.range_table = None
+        self.frames = {}
+
+    def update(self, rows):
+        for row in rows.iter_rows(named=True):
+            make, engine_type = row['Make'], row['Electric Vehicle Type']
+            electric_range, msrp = row['Electric Range'], row['Base MSRP']
+
+            self.year_count[row['Model Year']] = self.year_count.get(row['Model Year'], 0) + 1
+            self.make_count[make] = self.make_count.get(make, 0) + 1
+            models = self.model_count.setdefault(make, {})
+            models[row['Model']] = models.get(row['Model'], 0) + 1
+
+            if electric_range is not None and electric_range > 0:
+                stats = self.make_range.setdefault(make, [0, 0, electric_range, electric_range])
+                stats[0] += 1
+                stats[1] += electric_range
+                stats[2] = min(stats[2], electric_range)
+                stats[3] = max(stats[3], electric_range)
+
+                ranges = self.make_ranges.setdefault(make, {})
+                ranges[electric_range] = ranges.get(electric_range, 0) + 1
+                types = self.make_types.setdefault(make, {})
+                types[engine_type] = types.get(engine_type, 0) + 1
+
+                stats = self.type_range.setdefault(engine_type, [0, 0])
+                stats[0] += 1
+                stats[1] += electric_range
+
+                key = (make, electric_range, engine_type)
+                self.range_types[key] = self.range_types.get(key, 0) + 1
+
+            if msrp is not None and msrp > 0:
+                stats = self.type_msrp.setdefault(engine_type, [0, 0])
+                stats[0] += 1
+                stats[1] += msrp
+
+                stats = self.year_msrp.setdefault(row['Model Year'], [0, 0])
+                stats[0] += 1
+                stats[1] += msrp
+
+                if electric_range is not None and electric_range > 0:
+                    key = (electric_range, msrp, engine_type)
+                    self.range_msrp[key] = self.range_msrp.get(key, 0) + 1
+
+        self.range_table = None
+        self.frames = {}
+
+    def total(self):
+        '''
+        RETURN
+            int: numero totale di auto
+        '''
+        with self.lock:
+            return sum(self.year_count.values())
+
+    def make_counts(self):
+        '''
+        RETURN
+            dict: produttore -> numero di auto
+        '''
+        with self.lock:
+            return dict(self.make_count)
+
+    def model_counts(self, make):
+        '''
+        PARAM
+            string: produttore
+        RETURN
+            dict: modello -> numero di auto del produttore
+        '''
+        with self.lock:
+            return dict(self.model_count.get(make, {}))
+
+    def make_range_table(self):
+        '''
+        Funzione che ritorna la tabella delle statistiche dell'autonomia (> 0) per produttore.
+        La tabella viene calcolata una sola volta per versione del dataset
+
+        RETURN
+            dataframe: per ogni produttore
+                'Count': numero di auto
+                'Share': percentuale sul totale delle auto
+                'Min Range', 'Max Range', 'Mean Range': autonomia minima, massima e media
+                'Distinct Ranges': numero di valori diversi dell'autonomia
+                'BEV', 'PHEV': numero di auto per tipologia del motore
+        '''
+        with self.lock:
+            if self.range_table is None:
+                range_count = sum(stats[0] for stats in self.make_range.values())
+                self.range_table = pl.DataFrame(
+                    [
+                        (
+                            make,
+                            stats[0],
+                            stats[0]/range_count*100,
+                            stats[2],
+                            stats[3],
+                            stats[1]/stats[0],
+                            len(self.make_ranges[make]),
+                            self.make_types[make].get('Battery Electric Vehicle (BEV)', 0),
+                            self.make_types[make].get('Plug-in Hybrid Electric Vehicle (PHEV)', 0)
+                        )
+                        for make, stats in self.make_range.items()
+                    ],
+                    schema={
+                        'Make': pl.String,
+                        'Count': pl.Int64,
+                        'Share': pl.Float64,
+                        'Min Range': pl.Int64,
+                        'Max Range': pl.Int64,
+                        'Mean Range': pl.Float64,
+                        'Distinct Ranges': pl.Int64,
+                        'BEV': pl.Int64,
+                        'PHEV': pl.Int64
+                    },
+                    orient='row'
+                ).sort('Make')
+            return self.range_table
+
+    def type_range_stats(self):
+        '''
+        RETURN
+            dict: tipologia del motore -> (numero, somma) dell'autonomia
+        '''
+        with self.lock:
+            return {engine_type: tuple(stats) for engine_type, stats in self.type_range.items()}
+
+    def type_msrp_stats(self):
+        '''
+        RETURN
+            dict: tipologia del motore -> (numero, somma) del prezzo di listino
+        '''
+        with self.lock:
+            return {engine_type: tuple(stats) for engine_type, stats in self.type_msrp.items()}
+
+    def _frame(self, name, rows, schema):
+        # i dataframe dei grafici vengono creati una sola volta per versione del dataset
+        with self.lock:
+            if name not in self.frames:
+                self.frames[name] = pl.DataFrame(rows(), schema=schema, orient='row')
+            return self.frames[name]
+
+    def range_type_counts(self):
+        '''
+        RETURN
+            dataframe: 'Make', 'Electric Range', 'Electric Vehicle Type' e 'Count' numero di auto
+                       con autonomia maggiore di 0
+        '''
+        return self._frame(
+            'range-type',
+            lambda: [(*key, count) for key, count in self.range_types.items()],
+            {'Make': pl.String, 'Electric Range': pl.Int32, 'Electric Vehicle Type': pl.String, 'Count': pl.Int64}
+        )
+
+    def year_msrp_stats(self):
+        '''
+        RETURN
+            dataframe: 'Model Year', 'Count' numero e 'Sum' somma dei prezzi maggiori di 0
+        '''
+        return self._frame(
+            'year-msrp',
+            lambda: [(year, *stats) for year, stats in self.year_msrp.items()],
+            {'Model Year': pl.Int32, 'Count': pl.Int64, 'Sum': pl.Int64}
+        )
+
+    def range_msrp_counts(self):
+        '''
+        RETURN
+            dataframe: 'Electric Range', 'Base MSRP', 'Electric Vehicle Type' e 'Count' numero di auto
+                       con autonomia e prezzo maggiori di 0
+        '''
+        return self._frame(
+            'range-msrp',
+            lambda: [(*key, count) for key, count in self.range_msrp.items()],
+            {'Electric Range': pl.Int32, 'Base MSRP': pl.Int32, 'Electric Vehicle Type': pl.String, 'Count': pl.Int64}
+        )
+
+
+@st.cache_resource(show_spinner=False)
+def _running_totals():
+    return RunningTotals()
+
+
+def running_totals():
+    '''
+    Funzione che ritorna i totali incrementali della dashboard, condivisi tra le sessioni
+
+    RETURN
+        RunningTotals: totali aggiornati all'ultima versione del dataset
+    '''
+    return _running_totals().refresh()
@@ -0,0 +1,70 @@
+import threading
+from collections import OrderedDict
+
+'''
+Cache LRU condivisa tra le sessioni per i risultati che dipendono dalla versione del dataset.
+La chiave contiene sempre la firma del dataset (dataset.data_signature), quindi dopo una
+nuova vendita le voci della versione precedente non vengono più usate e vengono eliminate
+per prime, dato che sono le meno usate di recente.
+La cache è limitata sia nel numero di voci che nella memoria occupata.
+'''
+
+
+class LRUCache:
+    '''
+    Cache LRU limitata per numero di voci e per byte.
+    Ogni voce viene salvata con la sua dimensione in byte, quando uno dei due limiti viene superato
+    si eliminano le voci usate meno di recente
+    '''
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        '''
+        PARAM
+            tuple: chiave della voce
+        RETURN
+            valore salvato, None se la chiave non è presente
+        '''
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key][0]
+
+    def put(self, key, value, size):
+        '''
+        Funzione che salva una voce e poi elimina le voci meno usate finché i limiti sono rispettati.
+        Una voce più grande di max_bytes non viene salvata
+
+        PARAM
+            tuple: chiave della voce
+            value: valore da salvare
+            int: dimensione del valore in byte
+        '''
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries.pop(key)[1]
+            if size > self.max_bytes:
+                return
+            self.entries[key] = (value, size)
+            self.size += size
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                self.size -= self.entries.popitem(last=False)[1][1]
+
+    def stats(self):
+        '''
+        RETURN
+            dict: numero di voci, byte occupati, hit e miss della cache
+        '''
+        with self.lock:
+            return {'entries': len(self.entries), 'bytes': self.size, 'hits': self.hits, 'misses': self.misses}
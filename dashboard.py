@@ -1,25 +1,38 @@
 import streamlit as st
 import polars as pl
 import altair as alt
-import re
 import pydeck as pdk
-import pandas as pd
-from pathlib import Path
+import aggregates
+import cache
+import spatial
+import sampling
 
 
-def read_data():
+# I dati dei grafici vengono aggregati con polars prima di passarli ad Altair.
+# Il data transformer 'vegafusion' di Altair (installato con altair[all]) non servirebbe:
+# st.altair_chart serializza il grafico attivando un proprio data transformer ('id'),
+# che sostituisce quello abilitato, quindi al browser arriverebbero comunque tutte le righe
+
+# Livello di dettaglio iniziale della mappa 3D (celle da 2 km, si veda spatial.map_levels)
+map_level = 4
+# Scala dei colori delle celle, dalla meno alla più popolata (la stessa dell'HexagonLayer di pydeck)
+map_colors = [[255, 255, 178], [254, 217, 118], [254, 178, 76], [253, 141, 60], [240, 59, 32], [189, 0, 38]]
+
+
+@st.cache_resource(show_spinner=False)
+def _chart_cache():
     '''
-    Funzione che legge i dati del file csv del percorso: DATA/data.csv
+    Cache LRU dei grafici jitter, condivisa tra le sessioni.
+    La chiave contiene la firma del dataset, quindi dopo una nuova vendita i grafici vengono ricalcolati,
+    e la cache resta limitata anche con molte selezioni diverse dei produttori
 
     Returns:
-        dataframe: dataframe dei dati
+        LRUCache: cache dei grafici (al massimo 64 grafici e 64 MB di dati)
     '''
-    data_dir = Path('DATA')
-    data = pl.read_csv( data_dir/'data.csv')
-    return data
+    return cache.LRUCache(max_entries=64, max_bytes=64*1024*1024)
 
 
-def year_pop_chart(data):
+def year_pop_chart(cube):
     '''
     Funzione che ritorna un diagramma a barre in cui l'asse delle X rappresenta gli anni, mentre
     l'asse delle Y rappresenta il numero di auto vendute. 
@@ -28,15 +41,15 @@ def year_pop_chart(data):
     -Creazione del grafico a barre con i dati ricavati in precedenza
 
     Param: 
-        dataframe: dataframe dei dati
+        dataframe: cubo aggregato dei dati
     Return:
         chart: grafico a barre creato con altair
     '''
     data_chart = (
-        data
+        cube
         .group_by('Model Year', 'Electric Vehicle Type')
         .agg(
-            vendite_annuali = pl.col('Model Year').count()
+            vendite_annuali = pl.col('Count').sum()
         )
         .sort(pl.col('Model Year'), descending=False)
     )
@@ -83,41 +96,38 @@ def text_year_pop_chart(number):
 
 
 
-def make_pop_data(data):
+def make_pop_data(totals):
     '''
-    Funzione che dal dataframe generato dal file csv, si vanno a selezionare i dati 
+    Funzione che dai totali incrementali della dashboard, si vanno a selezionare i dati 
     del numero dei veicoli venduti per ogni produttore di auto presente nel dataset
 
     Param: 
-        dataframe: dataframe dei dati
+        RunningTotals: totali incrementali dei dati
     Return:
         dataframe: dataframe che contiene PRODUTTORE e NUMERO DI VENDITE
     '''
     data = (
-        data
-        .group_by('Make')
-        .agg(
-            Vendita_per_marca = pl.col('Make').count()
+        pl.DataFrame(
+            list(totals.make_counts().items()),
+            schema=['Make', 'Vendita_per_marca'],
+            orient='row'
         )
         .sort('Vendita_per_marca', descending = True)
     )
     return(data)
 
 
-def text_make_pop_data(data):
+def text_make_pop_data(totals):
     '''
     Testo che spiega il grafico che sarà presente alla destra della spiegazione
 
+    Param:
+        RunningTotals: totali incrementali dei dati
     Return:
         text: testo della spiegazione
     '''
     data_mod = (
-        data
-        .group_by('Make')
-        .agg(
-            Vendita = pl.col('Make').count()
-        )
-        .sort('Vendita', descending = True)
+        make_pop_data(totals)
         .select('Make')
     )
 
@@ -143,39 +153,39 @@ def text_make_pop_data(data):
 
 
 
-def make_list(data):
+def make_list(cube):
     '''
     Funzione che serve a creare una lista in cui sono presenti tutti i produttori di veicoli
     elettrici e ibridi presenti nel dataframe
 
     Param: 
-        dataframe: dataframe dei dati 
+        dataframe: cubo aggregato dei dati 
     Return:
         list: lista dei produttori
     '''
-    return data['Make'].unique().sort().to_list()
+    return cube['Make'].unique().sort().to_list()
 
 
-def make_per_year (data, make):
+def make_per_year (cube, make):
     '''
     Funzione che ha l'obiettivo di creare un grafico a linee 
     in cui in base ai produttore scelti dall'utente si vedranno il numero di auto 
     vendute da ogni produttore selezionato per ogni anno. 
 
     Param: 
-        dataframe: dataframe dei dati
+        dataframe: cubo aggregato dei dati
         list: lista dei produttori selezionati
 
     Return:
         chart: grafico a linee
     '''
     data = (
-        data
+        cube
+        .filter(pl.col('Make').is_in(make))
         .group_by('Make', 'Model Year')
         .agg(
-            Vendita_per_marca = pl.col('Make').count()
+            Vendita_per_marca = pl.col('Count').sum()
         )
-        .filter(pl.col('Make').is_in(make))
         .filter(pl.col('Model Year') < 2025)
     )
 
@@ -207,7 +217,7 @@ def make_per_year (data, make):
 
 
 
-def model_per_make(data, make):
+def model_per_make(cube, make):
     '''
     Funzione che va a generare grafici a torta per ogni produttore scelto dall'utente.
     Per ogni produttore saranno visibili il numero di modelli venduti. 
@@ -215,7 +225,7 @@ def model_per_make(data, make):
     La creazione dei grafici viene a seguito di una manipolazione dei dati.
 
     Param:
-        dataframe: dataframe dei dati 
+        dataframe: cubo aggregato dei dati 
         list: lista di produttore selezionati dall'utente
     '''
 
@@ -223,12 +233,12 @@ def model_per_make(data, make):
     Seleziono i dati che sono essenziali per creare il grafico
     '''
     data_agg = (
-        data
+        cube
+        .filter(pl.col('Make').is_in(make))
         .group_by('Make', 'Model')
         .agg(
-            Vendita_per_modello = pl.col('Model').count(),         
+            Vendita_per_modello = pl.col('Count').sum(),         
         )
-        .filter(pl.col('Make').is_in(make))
     )
 
     '''
@@ -311,35 +321,41 @@ def model_per_make(data, make):
 
     return(chart)
 
-def map_3d(data):
+def map_3d(data, level):
     '''
     Funzione che crea una mappa con visualizzazione 3D in cui si vede
     dove sono state immatricatolate le auto nello stato di Washington 
     andando a creare una specie di scatterplot in cui le barre più elevate
     indicano una zona in cui l'immatricolazione delle auto è maggiore. 
+    Le celle esagonali sono già calcolate su tutte le auto, quindi al browser
+    vengono inviati solo i centri delle celle con il numero di auto.
+    Lo zoom iniziale della mappa dipende dal livello: ogni livello dimezza il raggio
+    delle celle e aumenta lo zoom di uno.
 
     Param: 
-        dataframe: dataframe dei dati 
+        dataframe: numero di auto per cella esagonale del livello (spatial.MapPyramid)
+        int: livello della piramide (chiave di spatial.map_levels)
     '''
-    # Ottimizzazione 1: Selezione dati più efficiente
-    coord_list = []
+    radius = spatial.map_levels[level]
 
-    #selezione dei dati da usare
-    data = (
-        data.select(pl.col('Vehicle Location'))
+    count = pl.col('count')
+    # altezza e colore delle colonne scalati tra la cella meno e la più popolata
+    scaled = ((count - count.min())/pl.max_horizontal(count.max() - count.min(), 1))
+    # pydeck serializza i layer in JSON, i record delle celle vengono creati direttamente
+    # da polars senza passare da un DataFrame pandas
+    coord_chart = (
+        data
+        .with_columns(
+            pl.col('lon', 'lat').round(5),
+            elevation = (100 + scaled*900).round(1),
+            color = (
+                (scaled*len(map_colors)).floor().cast(pl.Int32).clip(0, len(map_colors) - 1)
+                .replace_strict(dict(enumerate(map_colors)), return_dtype=pl.List(pl.Int32))
+            )
+        )
+        .to_dicts()
     )
 
-    #manipolazione della colonna della geolocalizzazione
-    for row in data.rows():
-        if row[0] is not None:
-            numb = re.findall(r'-?\d+\.\d+|-?\d+', row[0])
-            coord = (float(numb[0]), float(numb[1]))
-            coord_list.append(coord)
-
-    #creazione del dataframe utile per la creazione del grafico
-    coord_chart = pd.DataFrame(coord_list, columns=['lon', 'lat'])
-    coord_chart = coord_chart.sample(n=100)
-
     #creazione del grafico tramite libreria PyDeck
     return(
         pdk.Deck(
@@ -347,53 +363,49 @@ def map_3d(data):
             initial_view_state=pdk.ViewState(
                 latitude=48,
                 longitude=-122,
-                zoom=7,
+                zoom=7 + level - map_level,
                 pitch=60,
             ),
             layers=[
                 pdk.Layer(
-                    "HexagonLayer",
+                    "ColumnLayer",
                     data=coord_chart,
                     get_position="[lon, lat]",
-                    radius=2000,
-                    elevation_scale=50,
-                    elevation_range=[100, 1000],
+                    get_elevation="elevation",
+                    get_fill_color="color",
+                    radius=radius,
+                    disk_resolution=6,
+                    angle=90,
+                    elevation_scale=50*radius/spatial.map_levels[map_level],
                     pickable=True,
                     extruded=True,
                 ),
-                pdk.Layer(
-                    "ScatterplotLayer",
-                    data=coord_chart,
-                    get_position="[lon, lat]",
-                    get_color="[200, 30, 0, 160]",
-                    get_radius=200,
-                ),
             ],
         )
     )
 
 
-def engine_type_per_make (data, make):
+def engine_type_per_make (cube, make):
     '''
     Funzione che crea grafici a torta in cui si vede come sono distribuite le auto immatricolate
     per marca rispetto alla tipologia di motore. 
 
     Param: 
-        dataset: dataset dei dati
+        dataset: cubo aggregato dei dati
         list: lista delle marche che si desidera analizzare
 
     Return: 
         chart: grafici che rappresentano la distribuzione dei motori
     '''
     data_type_engine = (
-        data
-        .group_by('Make', 'Electric Vehicle Type')
-        .agg(
-            Engine = pl.col('Electric Vehicle Type').count()
-        )
+        cube
         .filter(
             pl.col('Make').is_in(make)
         )
+        .group_by('Make', 'Electric Vehicle Type')
+        .agg(
+            Engine = pl.col('Count').sum()
+        )
     )
 
     data_type_engine = data_type_engine.with_columns(
@@ -460,22 +472,22 @@ def engine_type_per_make (data, make):
 
 
 
-def maker_list_over_25(data):
+def maker_list_over_25(cube):
     '''
     Funzione che mi crea una lista dei produttore che hanno venduto almeno il 0.25% delle auto presenti
     nel dataset. 
 
     Param
-        dataset: dataset dei dati
+        dataset: cubo aggregato dei dati
 
     Return
         list: lista contenente i produttori di auto con almneo 0.25% di vendite
     '''
     data = (
-        data
+        cube
         .group_by('Make')
         .agg(
-            Vendita_per_marca = (pl.col('Make').count() / len(data)*100).round(3)
+            Vendita_per_marca = (pl.col('Count').sum() / cube['Count'].sum()*100).round(3)
         )
         .filter(pl.col('Vendita_per_marca') > .5)
     )
@@ -484,13 +496,13 @@ def maker_list_over_25(data):
 
 
 
-def maker_small_report(data, maker, model_list): 
+def maker_small_report(cube, maker, model_list): 
 
     '''
     Funzione che mi crea un piccolo report sul produttore che viene selezionato
 
     PARAM
-        dataset: dataset dei dati
+        dataset: cubo aggregato dei dati
         string: produttore selezionato
         list: lista dei modelli per creare il grafico a linee
 
@@ -502,7 +514,7 @@ def maker_small_report(data, maker, model_list):
             [3] chart: grafico a linee che mostra quante auto sono state vendute per modello selezionato
     '''
 
-    data_maker = data.filter(pl.col('Make') == maker)
+    data_maker = cube.filter(pl.col('Make') == maker)
     # Primo anno in cui il produttore ha venduto un auto nello stato di Washington
     first_year = (
         data_maker
@@ -512,7 +524,7 @@ def maker_small_report(data, maker, model_list):
     # Numero di auto vendute dal produttore nello stato di Washington
     sell_car_count = (
         data_maker
-        .select(pl.col('Make')).count().item()  
+        .select(pl.col('Count')).sum().item()  
     )
 
     # Numero di modelli venduti dal produttore nello stato di Washington
@@ -526,7 +538,7 @@ def maker_small_report(data, maker, model_list):
         data_maker
         .group_by('Electric Vehicle Type')
         .agg(
-            ((pl.col('Electric Vehicle Type').count())/data_maker.height).round(2).alias('Engine Type Percentage')
+            (pl.col('Count').sum()/sell_car_count).round(2).alias('Engine Type Percentage')
         )
         .sort(pl.col('Electric Vehicle Type'))
     )
@@ -538,7 +550,7 @@ def maker_small_report(data, maker, model_list):
         data_maker
         .group_by('Make', 'Model', 'Model Year')
         .agg(
-            Total = pl.col('Model').count()
+            Total = pl.col('Count').sum()
         )
         .filter(pl.col('Model').is_in(model_list))
         .filter(pl.col('Total')>30)
@@ -577,7 +589,7 @@ def maker_small_report(data, maker, model_list):
 
 
 
-def model_list_by_maker(data, make):
+def model_list_by_maker(totals, make):
 
     '''
     Funzione che in base al produttore che viene passato come parametro
@@ -585,89 +597,56 @@ def model_list_by_maker(data, make):
     di auto vendute per quel modello
 
     Param: 
-        dataframe: dataframe dei dati
+        RunningTotals: totali incrementali dei dati
         string: nome del produttore
 
     Return: 
         list: lista contenente i modelli del produttore
     '''
-    data = (
-        data
-        .filter(pl.col('Make') == make)
-        .group_by('Make', 'Model')
-        .agg(
-            Total = pl.col('Model').count()
-        )
-        .sort('Total', descending = True)
-    )
+    model_counts = totals.model_counts(make)
 
+    return sorted(model_counts, key=model_counts.get, reverse=True)
 
-    return data['Model'].to_list()
 
+def range_make_list(range_table):
+    '''
+    Funzione che ritorna i produttori da mostrare nei grafici sull'autonomia:
+    quelli con più dello 0.5% delle auto, escludendo quelli con autonomia quasi costante
+    (differenza tra massima e minima minore di 5)
 
-def electric_range(data):
+    PARAM
+        dataframe: statistiche dell'autonomia per produttore (RunningTotals.make_range_table)
+    RETURN
+        list: lista ordinata dei produttori
+    '''
+    return (
+        range_table
+        .filter(pl.col('Share') > 0.5)
+        .filter((pl.col('Max Range') - pl.col('Min Range')) >= 5)
+        ['Make'].sort().to_list()
+    )
+
+
+def electric_range(totals):
     '''
     Funzione che mi genera un grafico con l'autonomia massima e minima per ogni produttore
     PARAM
-        dataset: dataset delle auto
+        RunningTotals: totali incrementali dei dati
     RETURN
         chart: grafico a barre in cui si vede per alcuni marchi il range massimo e il minimo venduto
         dataset: dataset in cui si vede per ogni produttore range massimo e minimo
     '''
-    data_range_prod = (
-        data
-        .select('Make', 'Electric Range', 'Electric Vehicle Type')
-        .filter(pl.col('Electric Range') > 0 )
-    )
-    data_range_prod = data_range_prod.with_columns(
-        pl.col('Electric Vehicle Type').replace({
-            'Plug-in Hybrid Electric Vehicle (PHEV)': 'PHEV',
-            'Battery Electric Vehicle (BEV)': 'BEV'
-        })
-    )
-
-    range_graph = (
-        data_range_prod
-        .group_by('Make','Electric Range', )
-        .agg(
-            Count = pl.col('Electric Range').count()
-        )
-        .sort('Make')
-    )
+    range_table = totals.make_range_table()
 
-    make_list = (
-        data_range_prod
-        .group_by('Make')
-        .agg(
-            Count = pl.col('Make').count()/data_range_prod.height*100
-        )
-        .filter(pl.col('Count') > 0.5)
-    )
-
-    make_list = make_list['Make'].unique().sort().to_list()
-    
-    filtered_data = (
-        range_graph
-        .group_by("Make")
-        .agg([
-            pl.col("Electric Range").max().alias("Max Range"),
-            pl.col("Electric Range").min().alias("Min Range"),
-        ])
-        
-    )
-
-    tot_electric_range = filtered_data
-
-    filtered_data = (
-        filtered_data
-        .filter((pl.col("Max Range") - pl.col("Min Range")) < 5)
-    )
-
-    filter_list = filtered_data['Make'].unique().sort().to_list()
+    tot_electric_range = range_table.select('Make', 'Max Range', 'Min Range')
     
+    # per ogni produttore bastano due righe, con l'autonomia minima e la massima
     range_graph_filt = (
-        range_graph
-        .filter(pl.col('Make').is_in(list(set(make_list) - set(filter_list))))
+        tot_electric_range
+        .filter(pl.col('Make').is_in(range_make_list(range_table)))
+        .unpivot(index='Make', on=['Min Range', 'Max Range'], value_name='Electric Range')
+        .drop('variable')
+        .sort('Make')
     )
     bar = (
         alt.Chart(range_graph_filt)
@@ -715,26 +694,27 @@ def engine_distribution(data):
     del motore e l'autonomia del motore elettrico.
 
     PARAM
-        data: dataset delle auto
+        data: numero di auto per produttore, autonomia e tipologia del motore (RunningTotals.range_type_counts)
 
     RETURN
         chart: grafico in cui si mostra la distribuzione per colore delle auto vendute in base all'autonomia
     '''
 
-    # Organizziamo il dataset per ottenere un dataset utile per creare il grafico
+    # Organizziamo il dataset per ottenere un dataset utile per creare il grafico:
+    # le auto sono già divise in intervalli di autonomia da 10
     data = (
         data
-        .select('Electric Vehicle Type', 'Electric Range')
-        .filter(pl.col('Electric Range') > 0)
-    )
-
-    data = (
-        data
-        .group_by('Electric Vehicle Type', 'Electric Range')
+        .with_columns(
+            (pl.col('Electric Range')//10*10).alias('Range Start')
+        )
+        .group_by('Electric Vehicle Type', 'Range Start')
         .agg(
-            Count = pl.col('Electric Range').count()
+            Count = pl.col('Count').sum().cast(pl.UInt32)
         )
-        .sort('Electric Range')
+        .with_columns(
+            (pl.col('Range Start') + 10).alias('Range End')
+        )
+        .sort('Range Start', 'Electric Vehicle Type')
     )
 
     data = data.with_columns(
@@ -744,14 +724,12 @@ def engine_distribution(data):
         })
     )
 
-    # Convertiamo il dataset in un DataFrame Pandas per Altair
-    df = data.to_pandas()
-
     base = (
-        alt.Chart(df)
+        alt.Chart(data)
         .mark_bar(cornerRadiusTopLeft=3, cornerRadiusTopRight=3, opacity=0.8)
         .encode(
-            x=alt.X('Electric Range:Q', title='Electric Range(interval of 10)',bin=alt.Bin(step=10)),
+            x=alt.X('Range Start:Q', title='Electric Range(interval of 10)', bin='binned'),
+            x2='Range End:Q',
             y=alt.Y('Count:Q'),
             color=alt.Color('Electric Vehicle Type:N', scale=alt.Scale(scheme='purpleorange'), legend=None)
         )
@@ -761,70 +739,100 @@ def engine_distribution(data):
 
 
 
-def range_label(data):
+def range_label(totals):
 
     '''
     Funzione che mi crea le etichette per aggiungere informazioni su numero auto vendute e autonomia
 
     PARAM
-        dataset: dataset dei dati
+        RunningTotals: totali incrementali dei dati
 
     RETURN
         list: lista contenente le informazioni utili per le auto
     '''
 
-    #organizzazione dei dati
-    data_label = (
-        data
-        .select('Electric Vehicle Type', 'Electric Range')
-        .filter(pl.col('Electric Range') > 0)
-    )
-
-    data_label = data_label.with_columns(
-        pl.col('Electric Vehicle Type').replace({
-            'Plug-in Hybrid Electric Vehicle (PHEV)': 'PHEV',
-            'Battery Electric Vehicle (BEV)': 'BEV'
-        })
-    )
+    # tipologia del motore -> (numero, somma) dell'autonomia, in ordine BEV, PHEV
+    range_stats = sorted(totals.type_range_stats().items())
 
     #numero record con cui si esegue l'analisi
     # numero di auto 
-    car_count = data_label.height
+    car_count = sum(stats[0] for _, stats in range_stats)
 
     #media dell'autonomia delle auto
-    data_mean = (
-        data_label
-        .mean()
-        .select('Electric Range').item()
-    )
+    data_mean = sum(stats[1] for _, stats in range_stats) / car_count
     
-    #calcoliamo il numero di auto e la media in base al motore
-    data_mean_by_engine = (
-        data_label
-        .group_by('Electric Vehicle Type')
+    #numero di auto e media in base al motore
+    data_mean_by_engine = [(stats[0], round(stats[1]/stats[0], 2)) for _, stats in range_stats]
+
+    return (car_count, round(data_mean,2),
+            data_mean_by_engine[0][0],data_mean_by_engine[0][1],
+            data_mean_by_engine[1][0],data_mean_by_engine[1][1])
+
+
+def _jitter_points(data, group, limit):
+    '''
+    Funzione che prepara i dati degli jitter strip plot senza inviare al browser le singole auto.
+    Le auto vengono contate per gruppo, autonomia e tipologia del motore, e con sampling.allocate si calcola
+    il numero di punti da disegnare per ogni valore, stratificando per gruppo, tipologia del motore e
+    intervallo di autonomia. I punti vengono poi generati nel browser con la trasformazione flatten di Vega-Lite
+
+    PARAM
+        dataset: numero di auto per produttore, autonomia e tipologia del motore (RunningTotals.range_type_counts)
+        list: colonne che definiscono i gruppi (lista vuota per un solo gruppo)
+        int: numero massimo di punti per gruppo
+
+    RETURN
+        dataset: colonne di group, 'Electric Range', 'Electric Vehicle Type' e 'Points' numero di punti
+    '''
+    values = group + ['Electric Range', 'Electric Vehicle Type']
+    counts = (
+        data
+        .group_by(values)
         .agg(
-            Count = pl.col('Electric Range').count(),
-            Mean = pl.col('Electric Range').mean()
-        )
-        .with_columns(
-            pl.col('Mean').round(2).alias('Mean')  
+            Count = pl.col('Count').sum()
         )
-        .sort(pl.col('Electric Vehicle Type'))
+        .with_columns(sampling.range_bucket_start())
+        .sort(values)
+    )
+    return (
+        sampling.allocate(counts, group + ['Electric Vehicle Type', 'Range Bucket'], group, limit)
+        .select(*values, 'Points')
     )
 
-    return (car_count, round(data_mean,2),
-            data_mean_by_engine.row(0)[1],data_mean_by_engine.row(0)[2],
-            data_mean_by_engine.row(1)[1],data_mean_by_engine.row(1)[2])
 
+def _jitter_chart(data):
+    '''
+    Funzione che crea il grafico di base degli jitter strip plot: ogni riga dei dati
+    viene ripetuta 'Points' volte nel browser e a ogni punto viene aggiunto uno spostamento
+    gaussiano sull'asse verticale. Lo spostamento è pseudo-casuale ma calcolato dall'indice
+    del punto e dall'autonomia, quindi il grafico è uguale a ogni rerun
 
-@st.cache_data
-def jitter_strip_plot(_data):
+    PARAM
+        dataset: dati preparati da _jitter_points
+
+    RETURN
+        chart: grafico a punti senza codifiche
+    '''
+    return alt.Chart(data).transform_calculate(
+        point = 'sequence(0, datum.Points)'
+    ).transform_flatten(
+        ['point']
+    ).transform_calculate(
+        u1 = "max(1e-6, abs(sin(datum.point*12.9898 + datum['Electric Range']*78.233)*43758.5453) % 1)",
+        u2 = "abs(sin(datum.point*39.3468 + datum['Electric Range']*11.135)*24634.6345) % 1"
+    ).transform_calculate(
+        jitter = "sqrt(-2*log(datum.u1))*cos(2*PI*datum.u2)"
+    ).mark_circle(size = 8)
+
+
+def jitter_strip_plot(data, signature):
 
     '''
     Funzione che mi genera un grafico di tipo jitter strip in base alla tipologia del motore
 
     PARAM: 
-        dataset: dataset dei dati 
+        dataset: numero di auto per produttore, autonomia e tipologia del motore (RunningTotals.range_type_counts)
+        tuple: firma del dataset, usata come chiave della cache
 
     RETURN: 
         chart: 
@@ -832,13 +840,13 @@ def jitter_strip_plot(_data):
             ASSE X: autonomia del motore elettrico
 '''
 
-    #organizzaione dei dati
-    data_strip_plot = (
-        _data
-        .select('Make', 'Electric Range', 'Electric Vehicle Type')
-        .filter(pl.col('Electric Range') > 0 )
-        .limit(10000)  
-    )
+    key = ('jitter_strip_plot', signature)
+    gaussian_jitter = _chart_cache().get(key)
+    if gaussian_jitter is not None:
+        return gaussian_jitter
+
+    #organizzaione dei dati: circa 10000 punti distribuiti come tutte le auto
+    data_strip_plot = _jitter_points(data, [], 10000)
     data_strip_plot = data_strip_plot.with_columns(
         pl.col('Electric Vehicle Type').replace({
             'Plug-in Hybrid Electric Vehicle (PHEV)': 'PHEV',
@@ -847,31 +855,30 @@ def jitter_strip_plot(_data):
     )
 
     #creazione del graifco 
-    gaussian_jitter = alt.Chart(data_strip_plot).mark_circle(size = 8).encode(
+    gaussian_jitter = _jitter_chart(data_strip_plot).encode(
         y = 'Electric Vehicle Type:N',
         x = 'Electric Range:Q',
         yOffset='jitter:Q',
         
         color=alt.Color('Electric Vehicle Type:N', scale=alt.Scale(scheme='purpleorange')).legend(None)
-    ).transform_calculate(
-        jitter = "sqrt(-2*log(random()))*cos(2*PI*random())"
     ).properties(
         height= 500,
         width = 500
-    )
+    ).resolve_scale(yOffset='independent')
 
-    return gaussian_jitter.resolve_scale(yOffset='independent')
+    _chart_cache().put(key, gaussian_jitter, data_strip_plot.estimated_size())
+    return gaussian_jitter
 
 
-@st.cache_data
-def make_jitter_strip_plot(_data, make): 
+def make_jitter_strip_plot(data, signature, make): 
 
     '''
     Grafico che mi genera un jitter strip plot per le auto che fanno parte della lista passata come parametro.
     Inoltre si vedono colori differenti in base alla tipologia del motore. 
 
     PARAM
-        dataset: dataset dei dati
+        dataset: numero di auto per produttore, autonomia e tipologia del motore (RunningTotals.range_type_counts)
+        tuple: firma del dataset, usata come chiave della cache
         list: lista delle auto che compongono il grafico
 
     RETURN
@@ -881,30 +888,21 @@ def make_jitter_strip_plot(_data, make):
                 COLORE: tipologia del motore
     '''
 
-    # Crea lista vuota per dataframe filtrati
-    df_list = []
+    key = ('make_jitter_strip_plot', signature, tuple(make))
+    gaussian_jitter = _chart_cache().get(key)
+    if gaussian_jitter is not None:
+        return gaussian_jitter
 
-    # Per ogni marca richiesta:
-    # - Filtra per marca specifica
-    # - Limita a 1000 record, per motivi di complessità computazionale
-    for i in make:
-        df_list.append(
-            _data
-            .select('Make', 'Electric Range', 'Electric Vehicle Type')
-            .filter(pl.col('Make') == i)
-            .filter(pl.col('Electric Range') > 0)
-            .limit(1000)
-        )
-
-    # Concatena risultati o crea DataFrame vuoto se nessun dato
-    if len(df_list) > 0:
-        jitter_plot = pl.concat(df_list)
-    else:
-        jitter_plot = pl.DataFrame(schema={"Make": pl.Utf8, "Electric Range": pl.Int32, "Electric Vehicle Type": pl.Utf8})
+    # Per le marche richieste al massimo circa 1000 punti per marca,
+    # per motivi di complessità computazionale
+    jitter_plot = _jitter_points(
+        data.filter(pl.col('Make').is_in(make)),
+        ['Make'],
+        1000
+    )
 
-    
     # Creo grafico con Altair
-    gaussian_jitter = alt.Chart(jitter_plot).mark_circle(size = 8).encode(
+    gaussian_jitter = _jitter_chart(jitter_plot).encode(
         y = 'Make:N',
         x = 'Electric Range:Q',
         yOffset='jitter:Q',
@@ -915,69 +913,27 @@ def make_jitter_strip_plot(_data, make):
                 range=['#9F9DB6', '#CBA575']  # Colori predefiniti per BEV e PHEV
         )
     )
-    ).transform_calculate(
-        jitter = "sqrt(-2*log(random()))*cos(2*PI*random())"
     ).properties(
         width = 700,
         height= 500
-    )
+    ).resolve_scale(yOffset='independent')
 
-    return (gaussian_jitter).resolve_scale(yOffset='independent')
+    _chart_cache().put(key, gaussian_jitter, jitter_plot.estimated_size())
+    return gaussian_jitter
     
 
-def make_jitter_strip_list(data):
+def make_jitter_strip_list(totals):
     '''
     Funzione che mi genera la lista per scegliere i produttori in base a dei parametri 
     per creare gli jitter strip plot
 
     PARAM
-        dataset: dataset dei dati
+        RunningTotals: totali incrementali dei dati
 
     RETURN
         list: lista dei produttori che rispettano determinati parametri
     '''
-    make_jitter_list = []
-
-    data_range_prod = (
-        data
-        .select('Make', 'Electric Range', 'Electric Vehicle Type')
-        .filter(pl.col('Electric Range') > 0 )
-    )
-
-    range_data = (
-        data_range_prod
-        .group_by('Make','Electric Range', )
-        .agg(
-            Count = pl.col('Electric Range').count()
-        )
-        .sort('Make')
-    )
-
-    make_data = (
-        data_range_prod
-        .group_by('Make')
-        .agg(
-            Count = pl.col('Make').count()/data_range_prod.height*100
-        )
-        .filter(pl.col('Count') > 0.5)
-    )
-
-    make_jitter_list = make_data['Make'].unique().sort().to_list()
-
-    filtered_data = (
-        range_data
-        .group_by("Make")
-        .agg([
-            pl.col("Electric Range").max().alias("Max Range"),
-            pl.col("Electric Range").min().alias("Min Range"),
-        ])
-        .filter((pl.col("Max Range") - pl.col("Min Range")) < 5)
-    )
-
-    filter_list = filtered_data['Make'].unique().sort().to_list()
-
-
-    return list(set(make_jitter_list) - set(filter_list))
+    return range_make_list(totals.make_range_table())
 
 
 
@@ -987,18 +943,17 @@ def year_mean_price(data):
     l'andamento medio del prezzo delle auto diviso per tipologia del motore.
 
     PARAM
-        dataset: dataset dei dati
+        dataset: numero e somma dei prezzi maggiori di 0 per anno (RunningTotals.year_msrp_stats)
 
     RETURN
         chart: grafico che mostra l'andamento della media dei prezzi negli anni
     '''
     data_mean_price = (
         data
-        .filter(pl.col('Base MSRP') > 0)
-        .group_by('Model Year')
-        .agg(
-            Mean = pl.col('Base MSRP').mean(),
-            Count = pl.col('Model Year').count()
+        .select(
+            'Model Year',
+            Mean = pl.col('Sum')/pl.col('Count'),
+            Count = pl.col('Count').cast(pl.UInt32)
         )
         .filter(pl.col('Count')>100)
         .sort('Model Year')
@@ -1021,25 +976,26 @@ def range_price_scatter_plot(data):
     all'autonomia e alla tipologia del motore
 
     PARAM
-        dataset: dataset dei dati
+        dataset: numero di auto per autonomia e prezzo maggiori di 0 e tipologia del motore
+                 (RunningTotals.range_msrp_counts)
 
     RETURN
         chart: scatterplot in cui si vedono autonomia e range di elettrico, con la suddivisione
             per la tipologia di motore
     '''
+    # un punto per ogni combinazione di autonomia, prezzo e motore, con il numero di auto
     data_scatter_plot = (
         data
-        .filter(pl.col('Base MSRP') > 0)
-        .select('Base MSRP', 'Electric Range', 'Electric Vehicle Type')
-        .filter(pl.col('Electric Range') > 0)
         .filter(pl.col('Base MSRP') < 120000)
+        .with_columns(pl.col('Count').cast(pl.UInt32))
+        .sort('Electric Range', 'Base MSRP', 'Electric Vehicle Type')
     )
 
     scatter_plot = alt.Chart(data_scatter_plot).mark_point().encode(
                         x='Electric Range:Q',
                         y='Base MSRP:Q',
                         color=alt.Color('Electric Vehicle Type:N', scale=alt.Scale(scheme='purpleorange')),
-                        size= 'count()'
+                        size=alt.Size('Count:Q', title='Count of Records')
                     ).properties(
                         width=600
                     )
@@ -1067,123 +1023,61 @@ def map_3d_text():
 '''
 Funzione che mi calcola la media del prezzo delle auto
 PARAM
-    dataset: dataset delle auto
+    RunningTotals: totali incrementali dei dati
 RETURN
-    list: [prezzo medio delle auto, prezzo medio BEV, prezzo medio PHEV]
+    list: [prezzo medio delle auto, prezzo medio BEV, prezzo medio PHEV, numero di auto]
 '''
-def mean_price(data):
-    data_mean_price = (
-        data
-        .filter(pl.col('Base MSRP') > 0)
-        .select(pl.col('Base MSRP').mean().round(2))
-    )
-    data_mean_price_engine = (
-        data
-        .filter(pl.col('Base MSRP') > 0)
-        .group_by('Electric Vehicle Type')
-        .agg(
-            Mean = pl.col('Base MSRP').mean().round(2)
-        )
-        .sort(pl.col('Electric Vehicle Type'))
-    )
-    return(data_mean_price.row(0)[0], 
-           data_mean_price_engine.row(0)[1],
-           data_mean_price_engine.row(1)[1],
-           data.filter(pl.col('Base MSRP') > 0).height)
+def mean_price(totals):
+    # tipologia del motore -> (numero, somma) del prezzo, in ordine BEV, PHEV
+    price_stats = sorted(totals.type_msrp_stats().items())
+
+    car_count = sum(stats[0] for _, stats in price_stats)
+    data_mean_price = round(sum(stats[1] for _, stats in price_stats) / car_count, 2)
+    data_mean_price_engine = [round(stats[1]/stats[0], 2) for _, stats in price_stats]
+
+    return(data_mean_price, 
+           data_mean_price_engine[0],
+           data_mean_price_engine[1],
+           car_count)
 
 '''
 Funzione che va a generare la pagina di dashboard
 '''
-def dashboard_main():
-
-    data = read_data()
-   
-    st.title(':orange[DASHBOARD]')
-    st.divider()
-    
-    #----------------------------------------------------------------------------------------------------
-    #PRIMO CONTAINER
-
+@st.fragment
+def map_section():
     '''
-    Container in cui verranno presentate le vendite annuali di auto suddivise per tipologia di motore.
-    Inoltre sono presenti informazioni sui dati utilizzati per creare il report
+    Terzo container: mappa 3D delle vendite.
+    Il cambio del livello di dettaglio riesegue solo questa sezione
     '''
-
-    st.title('Vendita auto BEV/PHEV')
-    c1 = st.container(border=False)
-    c1.subheader('Vendita annuale di auto BEV e PHEV')
-
-    col1c1, col2c1 = c1.columns(2)
-
-    col1c1.altair_chart(year_pop_chart(data), use_container_width=True)
-    col2c1.markdown(text_year_pop_chart(data.height), unsafe_allow_html=True)
-  
-    #----------------------------------------------------------------------------------------------------
-    #SECONDO CONTAINER
-
-    '''
-    Container in cui verranno presentate le vendite totali eseguite da ogni produttore presente nel dataset.
-    Inoltre verranno presentate delle considerazioni sui dati presenti
-    '''
-
-    c2 = st.container(border=False)
-    c2.subheader('Totale vendite per produttore')
-
-    col1c2, mid,col2c2 = c2.columns([3,1,2])
-    
-    
-    col2c2.dataframe(make_pop_data(data))
-    
-    col1c2.markdown(text_make_pop_data(data), unsafe_allow_html=True)
-    
-    st.divider()
-    #----------------------------------------------------------------------------------------------------
-    #TERZO CONTAINER
-
-    '''
-    Container in cui sarà presente una mappa 3d interattiva in cui si vede la distribuzione delle vendite 
-    di auto sulla mappa dello stato di Washington.
-    '''
-
     c3 = st.container(border=False)
     c3.title('Distribuzione vendite stato Washington')
     c3.markdown(map_3d_text(), unsafe_allow_html=True)
-    c3.pydeck_chart(map_3d(data))
 
-    st.divider()
-    
-    #----------------------------------------------------------------------------------------------------
-    #QUARTO CONTAINER
-    
+    # la mappa è la parte più pesante della sezione, viene calcolata solo se richiesta
+    if not c3.toggle('Mostra la mappa', key='show_map'):
+        return
+
+    level = c3.select_slider('Dettaglio della mappa',
+                             options=list(spatial.map_levels),
+                             value=map_level,
+                             format_func=lambda level: f'{spatial.map_levels[level]/1000:g} km')
+    c3.pydeck_chart(map_3d(spatial.map_pyramid().level(level), level))
+
+
+@st.fragment
+def make_section():
     '''
-    Container in cui è presente una grafico a linee che indica il numero di vendite annuali di al massimo
-    3 produttori selezionati a tramite una multiselect
+    Quarto, quinto e sesto container: vendite annuali, modelli e tipologia di motore dei produttori scelti.
+    I tre container dipendono dalla stessa multiselect, quindi vengono rieseguiti insieme
     '''
-    st.title('Analisi vendita per produttore')
-    st.markdown("""
-        <div style='border:2px solid orange; padding:20px; border-radius:5px;margin-bottom:50px;font-size:16px;'>
-            In questa sezione della dashboard, l'obiettivo è quello di analizzare i <span style="color: orange; font-weight: bold">dati dei vari produttori</span>.<br>
-            Si vuole fare questo in modo interattivo, mostrando approffondimenti sugli argomenti: 
-            <ul>
-                <li>Vendita annuale per produttore</li>
-                <li>Proporzione vendita dei vari modelli</li>
-                <li>Proporzione vendita per tipologia del motore</li>
-                <li>Report su un solo produttore scelto</li>
-            </ul>
-            <span style="color: orange; font-weight: bold">Informazioni</span>
-            <ul>
-                <li>Sull'analisi delle proporzione di vendita per modello, i modelli di auto che hanno una percentuale totale
-                inferiore all' 1%, sono stati raggruppati in una categoria: <span style="font-weight: bold">Altro</span>.</li>
-            </ul>
-        </div>
-        """, unsafe_allow_html=True)
+    cube = aggregates.cube()
 
     c4 = st.container(border=False)
     #make_selection è una lista di al massimo 3 marchi
     st.session_state.make_selection = c4.multiselect('''E' possibile scegliere al massimo 3 marchi''',
-                                                     make_list(data), max_selections=3, default=['CHEVROLET'])
+                                                     make_list(cube), max_selections=3, default=['CHEVROLET'])
     
-    c4.altair_chart(make_per_year(data, st.session_state.make_selection))
+    c4.altair_chart(make_per_year(cube, st.session_state.make_selection))
 
     #----------------------------------------------------------------------------------------------------
     #QUINTO CONTAINER
@@ -1198,7 +1092,7 @@ def dashboard_main():
 
     c5 = st.container(border=False)
     c5.subheader('Analisi vendita per modello')
-    c5.altair_chart(model_per_make(data, st.session_state.make_selection), use_container_width=True)
+    c5.altair_chart(model_per_make(cube, st.session_state.make_selection), use_container_width=True)
 
     #----------------------------------------------------------------------------------------------------
     #SESTO CONTAINER
@@ -1211,24 +1105,18 @@ def dashboard_main():
     
     c6 = st.container(border=False)
     c6.subheader('Analisi vendita per tipologia di motore')
-    c6.altair_chart(engine_type_per_make(data, st.session_state.make_selection))
+    c6.altair_chart(engine_type_per_make(cube, st.session_state.make_selection))
 
-    #----------------------------------------------------------------------------------------------------
-    #SETTIMO CONTAINER
 
+@st.fragment
+def maker_report_section():
     '''
-    Container in cui è stato creato un breve report su un produttore scelto tramite una selectbox. 
-    Per il produttore scelto si vedranno delle label: 
-    -Primo anno di vendita
-    -Totale auto vendute
-    -Percentuale auto BEV
-    -Percentuale auto PHEV
-    -Numero di modelli venduti
-
-    Inoltre è presente un grafico a linee in cui si vedono, di al massimo 2 modelli scelti tramite multiselect, 
-    le vendite annuali dei modelli scelti. 
+    Settimo container: report sul produttore scelto.
+    Il cambio del produttore o dei modelli riesegue solo questa sezione
     '''
-    
+    cube = aggregates.cube()
+    totals = aggregates.running_totals()
+
     c7 = st.container(border = True)
     
     c7.subheader('Analisi per produttore')
@@ -1243,9 +1131,9 @@ def dashboard_main():
 
     #è una stringa di al massimo un marchio
     st.session_state.prod_selection = c7.selectbox('''E' possibile scegliere al massimo UN marchio''',
-                                                     maker_list_over_25(data))
+                                                     maker_list_over_25(cube))
     
-    st.session_state.model_list = model_list_by_maker(data, st.session_state.prod_selection)
+    st.session_state.model_list = model_list_by_maker(totals, st.session_state.prod_selection)
     
     c7.divider()
 
@@ -1261,7 +1149,7 @@ def dashboard_main():
                                                       st.session_state.model_list,
                                                       max_selections=2, default=st.session_state.model_list[0])
 
-    st.session_state.report = maker_small_report(data,
+    st.session_state.report = maker_small_report(cube,
                                                st.session_state.prod_selection,
                                                st.session_state.model_selection)
     
@@ -1280,7 +1168,161 @@ def dashboard_main():
     col1c7.metric(label="**Numero di modelli venduti**", value = st.session_state.report[2])
     col2c7.altair_chart(st.session_state.report[3], use_container_width=True)
 
+
+@st.fragment
+def make_jitter_section():
+    '''
+    Undicesimo container: jitter strip plot dei produttori scelti.
+    Il cambio dei produttori riesegue solo questa sezione
+    '''
+    totals = aggregates.running_totals()
+    signature = totals.signature
+
+    c11 = st.container()
+    c11.subheader('Distribuzione autonomia delle auto per produttore')
+    c11.write('')
+
+    col1c11, col2c11 = c11.columns(spec=[0.4, 0.6])
+
+    col1c11.markdown("""
+        <div style='border:2px solid orange; padding:10px; border-radius:5px;margin-bottom:15px;font-size:16px;margin-top:25px;'>
+            <span style="color: orange; font-weight: bold">Obiettivo del grafico</span>
+            <br>
+            Con questo grafico si vuole analizzare come sono distribuiti 
+            i dati dell'autonomia del motore elettrico presente nelle auto. Inoltro per ogni produttore
+            viene visualizzata la tipologia del motore tramite l'utilizzo dei colori. <br>      
+            <br>
+            <span style="color: orange; font-weight: bold">Consigli su interpretazione</span> <br>
+            Un punto indica che è presente un dato di un determinato valore di autonomia dell'auto. Quindi per non
+            sovrapporre i punti è stato aggiunto un valore casuale sull'asse verticale. Più una linea verticale è piena,
+            più sono i dati presenti con la stessa autonomia. <br><br>
+            <span style="color: orange; font-weight: bold">Informazioni</span> <br>
+            Per motivi di visualizzazione e di complessità di calcolo, quindi aumento di tempo per la visualizzazione
+            del grafico, i dati sono stati limitati a 1000 per ogni produttore, questa quantità permette una visualizzazione
+            soddisfaciente delle informazioni.
+        </div>
+        """, unsafe_allow_html=True)
+    
+    st.session_state.jitter_make_list = make_jitter_strip_list(totals)
+
+    st.session_state.jitter_make_selection = col2c11.multiselect('''E' possibile scegliere al massimo 3 modelli''', 
+                        st.session_state.jitter_make_list, 
+                        st.session_state.jitter_make_list[0])
+    
+    if col2c11.toggle('Mostra il grafico', key='show_make_jitter'):
+        col2c11.altair_chart(make_jitter_strip_plot(totals.range_type_counts(), signature,
+                                                    st.session_state.jitter_make_selection))
+
+
+def sales_section():
+    '''
+    Sezione della dashboard sulle vendite: vendite annuali, vendite per produttore,
+    mappa 3D e analisi dei produttori (container 1-7)
+    '''
+    cube = aggregates.cube()
+    totals = aggregates.running_totals()
+
+    #----------------------------------------------------------------------------------------------------
+    #PRIMO CONTAINER
+
+    '''
+    Container in cui verranno presentate le vendite annuali di auto suddivise per tipologia di motore.
+    Inoltre sono presenti informazioni sui dati utilizzati per creare il report
+    '''
+
+    st.title('Vendita auto BEV/PHEV')
+    c1 = st.container(border=False)
+    c1.subheader('Vendita annuale di auto BEV e PHEV')
+
+    col1c1, col2c1 = c1.columns(2)
+
+    col1c1.altair_chart(year_pop_chart(cube), use_container_width=True)
+    col2c1.markdown(text_year_pop_chart(totals.total()), unsafe_allow_html=True)
+  
+    #----------------------------------------------------------------------------------------------------
+    #SECONDO CONTAINER
+
+    '''
+    Container in cui verranno presentate le vendite totali eseguite da ogni produttore presente nel dataset.
+    Inoltre verranno presentate delle considerazioni sui dati presenti
+    '''
+
+    c2 = st.container(border=False)
+    c2.subheader('Totale vendite per produttore')
+
+    col1c2, mid,col2c2 = c2.columns([3,1,2])
+    
+    
+    col2c2.dataframe(make_pop_data(totals))
+    
+    col1c2.markdown(text_make_pop_data(totals), unsafe_allow_html=True)
+    
     st.divider()
+    #----------------------------------------------------------------------------------------------------
+    #TERZO CONTAINER
+
+    '''
+    Container in cui sarà presente una mappa 3d interattiva in cui si vede la distribuzione delle vendite 
+    di auto sulla mappa dello stato di Washington.
+    '''
+
+    map_section()
+
+    st.divider()
+    
+    #----------------------------------------------------------------------------------------------------
+    #QUARTO CONTAINER
+    
+    '''
+    Container in cui è presente una grafico a linee che indica il numero di vendite annuali di al massimo
+    3 produttori selezionati a tramite una multiselect
+    '''
+    st.title('Analisi vendita per produttore')
+    st.markdown("""
+        <div style='border:2px solid orange; padding:20px; border-radius:5px;margin-bottom:50px;font-size:16px;'>
+            In questa sezione della dashboard, l'obiettivo è quello di analizzare i <span style="color: orange; font-weight: bold">dati dei vari produttori</span>.<br>
+            Si vuole fare questo in modo interattivo, mostrando approffondimenti sugli argomenti: 
+            <ul>
+                <li>Vendita annuale per produttore</li>
+                <li>Proporzione vendita dei vari modelli</li>
+                <li>Proporzione vendita per tipologia del motore</li>
+                <li>Report su un solo produttore scelto</li>
+            </ul>
+            <span style="color: orange; font-weight: bold">Informazioni</span>
+            <ul>
+                <li>Sull'analisi delle proporzione di vendita per modello, i modelli di auto che hanno una percentuale totale
+                inferiore all' 1%, sono stati raggruppati in una categoria: <span style="font-weight: bold">Altro</span>.</li>
+            </ul>
+        </div>
+        """, unsafe_allow_html=True)
+
+    make_section()
+
+    #----------------------------------------------------------------------------------------------------
+    #SETTIMO CONTAINER
+
+    '''
+    Container in cui è stato creato un breve report su un produttore scelto tramite una selectbox. 
+    Per il produttore scelto si vedranno delle label: 
+    -Primo anno di vendita
+    -Totale auto vendute
+    -Percentuale auto BEV
+    -Percentuale auto PHEV
+    -Numero di modelli venduti
+
+    Inoltre è presente un grafico a linee in cui si vedono, di al massimo 2 modelli scelti tramite multiselect, 
+    le vendite annuali dei modelli scelti. 
+    '''
+    
+    maker_report_section()
+
+
+def range_section():
+    '''
+    Sezione della dashboard sull'autonomia delle auto (container 8-11)
+    '''
+    totals = aggregates.running_totals()
+    signature = totals.signature
 
     st.title('Analisi tecnica delle auto')
 
@@ -1317,8 +1359,8 @@ def dashboard_main():
 
     col1c8, col2c8 = c8.columns(spec=[.6,.4])
 
-    col1c8.altair_chart(engine_distribution(data), use_container_width=True)
-    st.session_state.range_label = range_label(data)
+    col1c8.altair_chart(engine_distribution(totals.range_type_counts()), use_container_width=True)
+    st.session_state.range_label = range_label(totals)
 
     a,b = col2c8.columns(2)
     a.metric(label = '**Numero totale auto**', value = st.session_state.range_label[0])
@@ -1349,7 +1391,7 @@ def dashboard_main():
     c9.subheader('Analisi su autonomia massima e minima')
     c9.write('')
 
-    electric_range_result = electric_range(data)
+    electric_range_result = electric_range(totals)
     col1c9, col2c9, col3c9 = c9.columns(3)
     col3c9.altair_chart(electric_range_result[0])
     col2c9.write(electric_range_result[1])
@@ -1383,7 +1425,8 @@ def dashboard_main():
     c10.write('')
 
     col1c10, col2c10 = c10.columns(spec=[0.6, 0.4])
-    col1c10.altair_chart(jitter_strip_plot(data))
+    if col1c10.toggle('Mostra il grafico', key='show_jitter'):
+        col1c10.altair_chart(jitter_strip_plot(totals.range_type_counts(), signature))
     col2c10.markdown("""
         <div style='border:2px solid orange; padding:10px; border-radius:5px;margin-bottom:15px;font-size:16px;'>
             <span style="color: orange; font-weight: bold">Obiettivo del grafico</span>
@@ -1415,43 +1458,14 @@ def dashboard_main():
 
     st.divider()
     
-    c11 = st.container()
-    c11.subheader('Distribuzione autonomia delle auto per produttore')
-    c11.write('')
-
-    col1c11, col2c11 = c11.columns(spec=[0.4, 0.6])
-
-    col1c11.markdown("""
-        <div style='border:2px solid orange; padding:10px; border-radius:5px;margin-bottom:15px;font-size:16px;margin-top:25px;'>
-            <span style="color: orange; font-weight: bold">Obiettivo del grafico</span>
-            <br>
-            Con questo grafico si vuole analizzare come sono distribuiti 
-            i dati dell'autonomia del motore elettrico presente nelle auto. Inoltro per ogni produttore
-            viene visualizzata la tipologia del motore tramite l'utilizzo dei colori. <br>      
-            <br>
-            <span style="color: orange; font-weight: bold">Consigli su interpretazione</span> <br>
-            Un punto indica che è presente un dato di un determinato valore di autonomia dell'auto. Quindi per non
-            sovrapporre i punti è stato aggiunto un valore casuale sull'asse verticale. Più una linea verticale è piena,
-            più sono i dati presenti con la stessa autonomia. <br><br>
-            <span style="color: orange; font-weight: bold">Informazioni</span> <br>
-            Per motivi di visualizzazione e di complessità di calcolo, quindi aumento di tempo per la visualizzazione
-            del grafico, i dati sono stati limitati a 1000 per ogni produttore, questa quantità permette una visualizzazione
-            soddisfaciente delle informazioni.
-        </div>
-        """, unsafe_allow_html=True)
-    
-    st.session_state.jitter_make_list = make_jitter_strip_list(data)
+    make_jitter_section()
 
-    st.session_state.jitter_make_selection = col2c11.multiselect('''E' possibile scegliere al massimo 3 modelli''', 
-                        st.session_state.jitter_make_list, 
-                        st.session_state.jitter_make_list[0])
-    
-    col2c11.altair_chart(make_jitter_strip_plot(data, 
-                                                st.session_state.jitter_make_selection))
-    
 
-    #----------------------------------------------------------------------------------------------------
-    st.divider()
+def price_section():
+    '''
+    Sezione della dashboard sui prezzi delle auto (container 12-13)
+    '''
+    totals = aggregates.running_totals()
 
     # Parte dell'analisi sui prezzi.
 
@@ -1477,11 +1491,11 @@ def dashboard_main():
     c12.subheader('Andamento annuale del prezzo medio delle auto')
 
     #dati sui prezzi
-    st.session_state.mean_price = mean_price(data)
+    st.session_state.mean_price = mean_price(totals)
 
     col1c12, col2c12 = c12.columns(spec=[0.5, 0.5])
 
-    col1c12.altair_chart(year_mean_price(data))
+    col1c12.altair_chart(year_mean_price(totals.year_msrp_stats()))
 
     col2c12.markdown(f"""
         <div style='border:2px solid orange; padding:10px; border-radius:5px;margin-bottom:15px;font-size:16px;'>
@@ -1518,7 +1532,8 @@ def dashboard_main():
     c13.write('')
     col1c13, col2c13 = c13.columns(spec=[.5, .5])
 
-    col2c13.altair_chart(range_price_scatter_plot(data))
+    if col2c13.toggle('Mostra il grafico', key='show_scatter'):
+        col2c13.altair_chart(range_price_scatter_plot(totals.range_msrp_counts()))
     col1c13.markdown("""
         <div style='border:2px solid orange; padding:10px; border-radius:5px;margin-bottom:15px;font-size:16px;'>
             <span style="color: orange; font-weight: bold">Informazioni sull'analisi</span> <br>
@@ -1536,6 +1551,32 @@ def dashboard_main():
         </div>
         """, unsafe_allow_html=True)
 
+
+# Sezioni della dashboard: solo la sezione scelta viene calcolata e mostrata
+dashboard_sections = {
+    'Vendite': sales_section,
+    'Autonomia': range_section,
+    'Prezzi': price_section,
+}
+
+
+def dashboard_main():
+    '''
+    Funzione che mostra la dashboard. Le sezioni vengono scelte con un controllo segmentato
+    e viene calcolata solo la sezione scelta, quindi il tempo per mostrare la pagina
+    dipende solo da quella sezione
+    '''
+    st.title(':orange[DASHBOARD]')
+
+    section = st.segmented_control('Sezione della dashboard',
+                                   list(dashboard_sections),
+                                   default='Vendite',
+                                   key='dashboard_section')
+    st.divider()
+
+    # se la sezione viene deselezionata si mostra la prima
+    dashboard_sections.get(section, sales_section)()
+
+
 if __name__ == '__main__':
     dashboard_main()
-    
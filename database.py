@@ -0,0 +1,204 @@
+import streamlit as st
+import logging
+import sqlite3
+import queue
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+'''
+Accesso al database degli utenti (DATABASE/user.db) condiviso tra le sessioni:
+- Le connessioni sono tenute in un pool limitato (pool_size) condiviso da tutte le sessioni
+  del processo: le connessioni vengono riusate e restituite al pool anche in caso di errore,
+  quindi non restano file aperti
+- Il database usa il journal WAL: le letture (login) non vengono bloccate dalle scritture
+  (registrazioni, modifiche dell'admin) e le scritture non bloccano le letture
+- Con busy_timeout una scrittura che trova il database occupato da un altro processo
+  attende invece di fallire subito
+- Le query sono costanti con parametri: sqlite le prepara una volta per connessione
+  e le riusa dalla cache delle istruzioni preparate
+- Al login viene letto solo l'utente con la mail inserita, con una ricerca sull'indice univoco
+  della mail senza distinzione tra maiuscole e minuscole. Le ricerche recenti sono tenute in
+  una cache con scadenza (user_ttl), svuotata a ogni scrittura sul database
+'''
+
+db_file = Path('DATABASE')/'user.db'
+
+# Numero massimo di connessioni aperte per processo
+pool_size = 4
+# Secondi di attesa di una connessione libera del pool
+pool_timeout = 10
+# Millisecondi di attesa quando il database è bloccato da un altro processo
+busy_timeout = 5000
+# Secondi di validità delle ricerche degli utenti nella cache, limite per le modifiche
+# fatte dagli altri processi del server
+user_ttl = 30
+# Numero massimo di ricerche degli utenti nella cache
+user_cache_entries = 1024
+
+CREATE_MAIL_INDEX = 'CREATE UNIQUE INDEX IF NOT EXISTS USER_MAIL_NOCASE ON USER(Mail COLLATE NOCASE)'
+SELECT_USER = 'SELECT Password, User_Type, Name_Surname FROM USER WHERE Mail = ? COLLATE NOCASE'
+SELECT_USERS_DATA = 'SELECT Mail, User_Type, Name_Surname FROM USER'
+INSERT_USER = 'INSERT INTO USER(Mail, Name_Surname, User_Type, Password) VALUES (?, ?, ?, ?)'
+UPDATE_PASSWORD = 'UPDATE USER SET Password = ? WHERE Mail = ? COLLATE NOCASE'
+UPDATE_USER_TYPE = 'UPDATE USER SET User_Type = ? WHERE Mail = ? COLLATE NOCASE'
+DELETE_USER = 'DELETE FROM USER WHERE Mail = ? COLLATE NOCASE'
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionPool:
+    '''
+    Pool limitato di connessioni sqlite.
+    Le connessioni vengono create solo quando servono, fino a size; se sono tutte in uso
+    si attende che una venga restituita al massimo timeout secondi
+    '''
+
+    def __init__(self, path, size=pool_size, timeout=pool_timeout):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.idle = queue.LifoQueue(maxsize=size)
+        self.created = 0
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        # la connessione passa tra i thread delle sessioni, ma è usata da un solo thread alla volta
+        db = sqlite3.connect(self.path, timeout=busy_timeout/1000, check_same_thread=False)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute(f'PRAGMA busy_timeout={busy_timeout}')
+        db.execute('PRAGMA synchronous=NORMAL')
+        return db
+
+    def _acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            create = self.created < self.size
+            if create:
+                self.created += 1
+        if create:
+            try:
+                return self._connect()
+            except Exception:
+                with self.lock:
+                    self.created -= 1
+                raise
+        try:
+            return self.idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError('Nessuna connessione libera al database') from None
+
+    @contextmanager
+    def connection(self):
+        '''
+        Context manager che presta una connessione del pool.
+        All'uscita la transazione viene confermata, o annullata in caso di errore,
+        e la connessione torna nel pool
+
+        RETURN
+            connection: connessione sqlite
+        '''
+        db = self._acquire()
+        try:
+            with db:
+                yield db
+        finally:
+            self.idle.put(db)
+
+    def close(self):
+        '''
+        Funzione che chiude le connessioni libere del pool
+        '''
+        while True:
+            try:
+                db = self.idle.get_nowait()
+            except queue.Empty:
+                return
+            db.close()
+            with self.lock:
+                self.created -= 1
+
+
+@st.cache_resource(show_spinner=False)
+def pool():
+    '''
+    Funzione che ritorna il pool di connessioni del database degli utenti, uno per processo
+
+    RETURN
+        ConnectionPool: pool di connessioni
+    '''
+    connections = ConnectionPool(db_file)
+    try:
+        with connections.connection() as db:
+            db.execute(CREATE_MAIL_INDEX)
+    except sqlite3.IntegrityError:
+        # mail già presenti che differiscono solo per maiuscole e minuscole
+        logger.exception('Indice univoco delle mail non creato')
+    return connections
+
+
+def query(sql, params=()):
+    '''
+    Funzione che esegue una query di lettura
+
+    PARAM
+        string: query sql costante
+        tuple: parametri della query
+    RETURN
+        list: righe del risultato
+    '''
+    with pool().connection() as db:
+        return db.execute(sql, params).fetchall()
+
+
+def execute(sql, params=()):
+    '''
+    Funzione che esegue una query di scrittura e conferma la transazione
+
+    PARAM
+        string: query sql costante
+        tuple: parametri della query
+    RETURN
+        int: numero di righe modificate
+    '''
+    with pool().connection() as db:
+        rowcount = db.execute(sql, params).rowcount
+    _find_user.clear()
+    return rowcount
+
+
+@st.cache_data(ttl=user_ttl, max_entries=user_cache_entries, show_spinner=False)
+def _find_user(mail):
+    rows = query(SELECT_USER, (mail,))
+    if not rows:
+        return None
+    password, user_type, username = rows[0]
+    return {'password': password, 'user_type': user_type, 'username': username}
+
+
+def normalize_mail(mail):
+    '''
+    Funzione che normalizza la mail inserita dall'utente, da usare per tutte le query sulla mail
+    e per l'invio delle mail
+
+    PARAM
+        string: mail inserita
+    RETURN
+        string: mail senza spazi iniziali e finali, in minuscolo
+    '''
+    return mail.strip().lower()
+
+
+def find_user(mail):
+    '''
+    Funzione che cerca un utente per mail, senza distinzione tra maiuscole e minuscole
+
+    PARAM
+        string: mail dell'utente
+    RETURN
+        dict: 'password', 'user_type' e 'username' dell'utente, None se la mail non è registrata
+    '''
+    return _find_user(normalize_mail(mail))
@@ -0,0 +1,520 @@
+import streamlit as st
+import polars as pl
+from pathlib import Path
+from contextlib import contextmanager
+import argparse
+import copy
+import hashlib
+import os
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:
+    # su Windows non è disponibile il lock dei file tra processi
+    fcntl = None
+
+'''
+Gestisce la copia condivisa del dataset delle immatricolazioni:
+- Il dataset è salvato in formato colonnare Arrow IPC (DATA/data.arrow), con colonne
+  tipizzate e la posizione del veicolo già divisa in longitudine e latitudine
+- Il file csv (DATA/data.csv) è usato solo come formato di import/export: se il file
+  Arrow non esiste viene creato automaticamente dal csv
+- Le nuove vendite non riscrivono il dataset: ogni vendita viene salvata in un piccolo
+  file Arrow nella cartella DATA/sales (registro delle vendite in sola aggiunta).
+  Periodicamente i file delle vendite vengono compattati nel file principale
+- Il file viene letto una sola volta per processo e la stessa copia viene
+  riutilizzata da tutte le sessioni (dashboard e vendita)
+- La copia viene invalidata quando cambiano data di modifica o dimensione del file,
+  i file delle vendite presenti, oppure quando viene incrementata la versione
+  esplicita con bump_version()
+- Il dataframe condiviso è in sola lettura: le funzioni che lo usano devono sempre
+  creare nuovi dataframe (filter, with_columns, concat...) senza modificarlo
+- Le tabelle derivate dal dataset che conviene non ricalcolare a ogni avvio vengono
+  salvate nella cartella DATA/derived, con la versione del dataset nel nome del file.
+  Sono scritte una sola volta e tutti i processi del server le mappano in memoria in sola
+  lettura, quindi le pagine sono condivise e un nuovo processo non ricalcola nulla
+'''
+
+data_dir = Path('DATA')
+csv_file = data_dir/'data.csv'
+data_file = data_dir/'data.arrow'
+sales_dir = data_dir/'sales'
+derived_dir = data_dir/'derived'
+
+# lock condiviso dai lettori, esclusivo durante la sostituzione del file principale
+data_lock_file = data_dir/'.data.lock'
+# lock che garantisce una sola compattazione alla volta
+compact_lock_file = data_dir/'.compact.lock'
+
+# Numero di vendite nel registro oltre il quale viene avviata la compattazione
+compact_threshold = 50
+
+# Numero di versioni di ogni tabella derivata tenute su disco: le versioni precedenti
+# possono essere ancora in uso da processi che non hanno visto l'ultima vendita
+derived_versions = 3
+
+# Tipi delle colonne numeriche, le altre colonne del csv restano stringhe
+schema_overrides = {
+    'Model Year': pl.Int32,
+    'Electric Range': pl.Int32,
+    'Base MSRP': pl.Int32,
+}
+
+# Versione esplicita del dataset, incrementata da bump_version() per forzare la rilettura
+_version = 0
+
+# Evento segnalato quando il dataset cambia in questo processo (nuova vendita, compattazione,
+# bump_version), usato per svegliare subito il thread di precalcolo (warmup.py)
+data_changed = threading.Event()
+
+
+def location_columns():
+    '''
+    Funzione che ritorna le espressioni per dividere la colonna 'Vehicle Location',
+    nel formato 'POINT (lon lat)', nelle colonne 'lon' e 'lat' di tipo Float64
+
+    RETURN
+        list: espressioni polars per le colonne 'lon' e 'lat'
+    '''
+    location = pl.col('Vehicle Location')
+    return [
+        location.str.extract(r'POINT \((\S+) ', 1).cast(pl.Float64, strict=False).alias('lon'),
+        location.str.extract(r' (\S+)\)', 1).cast(pl.Float64, strict=False).alias('lat'),
+    ]
+
+
+def _write_atomic(data, target):
+    '''
+    Funzione che scrive il dataframe in formato Arrow IPC su un file temporaneo
+    e poi lo sostituisce al file di destinazione. I processi che hanno il vecchio file
+    mappato in memoria continuano a leggere la versione precedente senza errori.
+
+    PARAM
+        dataframe: dati da scrivere
+        path: file di destinazione
+    '''
+    tmp = target.with_name(f'.{target.name}.{uuid.uuid4().hex}.tmp')
+    # non compresso, così il file può essere mappato in memoria in lettura
+    data.write_ipc(tmp, compression='uncompressed')
+    os.replace(tmp, target)
+
+
+@contextmanager
+def _file_lock(path, exclusive=False, blocking=True):
+    '''
+    Context manager che acquisisce un lock (condiviso o esclusivo) sul file passato
+    come parametro, valido anche tra processi diversi
+
+    PARAM
+        path: file usato come lock
+        boolean: True per il lock esclusivo, False per quello condiviso
+        boolean: False per non attendere se il lock è già occupato
+    RETURN
+        boolean: True se il lock è stato acquisito, False altrimenti
+    '''
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'a') as f:
+        if fcntl is None:
+            yield True
+            return
+        flags = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+        if not blocking:
+            flags |= fcntl.LOCK_NB
+        try:
+            fcntl.flock(f, flags)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _sale_files():
+    '''
+    Funzione che ritorna i nomi dei file del registro delle vendite, in ordine di inserimento
+
+    RETURN
+        tuple: nomi dei file delle vendite non ancora compattate
+    '''
+    if not sales_dir.exists():
+        return ()
+    return tuple(sorted(entry.name for entry in os.scandir(sales_dir)
+                        if entry.name.endswith('.arrow')))
+
+
+def convert_csv(source=csv_file, target=data_file):
+    '''
+    Funzione che converte il file csv dei dati nel formato Arrow IPC
+
+    PARAM
+        path: file csv da convertire
+        path: file Arrow da creare
+    RETURN
+        dataframe: dataframe dei dati convertiti
+    '''
+    data = (
+        pl.read_csv(source, schema_overrides=schema_overrides)
+        .with_columns(location_columns())
+    )
+    _write_atomic(data, target)
+    return data
+
+
+def export_csv(target=csv_file):
+    '''
+    Funzione che esporta il dataset nel formato csv originale (senza le colonne 'lon' e 'lat').
+    Prima dell'esportazione le vendite del registro vengono compattate nel file principale,
+    così il csv esportato può essere riconvertito senza duplicare le vendite.
+    Il lock della compattazione è tenuto fino alla fine della scrittura del csv: se una
+    compattazione è già in corso si aspetta che termini, così non si esporta il file principale
+    precedente mentre le sue vendite vengono cancellate dal registro
+
+    PARAM
+        path: file csv da creare
+    '''
+    with _file_lock(compact_lock_file, exclusive=True):
+        _compact()
+        pl.read_ipc(data_file).drop('lon', 'lat').write_csv(target, separator=',')
+
+
+def data_signature():
+    '''
+    Funzione che ritorna la firma del dataset, usata come chiave della cache condivisa.
+    Se il file Arrow non esiste ancora viene creato a partire dal csv.
+
+    RETURN
+        tuple: (versione esplicita, data di ultima modifica in ns, dimensione in byte,
+                file delle vendite non ancora compattate)
+    '''
+    if not data_file.exists():
+        convert_csv()
+    stat = data_file.stat()
+    return (_version, stat.st_mtime_ns, stat.st_size, _sale_files())
+
+
+def data_version(signature):
+    '''
+    Funzione che ritorna la versione del contenuto del dataset, uguale per tutti i processi.
+    Non dipende dalla versione esplicita, che è locale al processo
+
+    PARAM
+        tuple: firma del dataset
+    RETURN
+        string: codice esadecimale della versione
+    '''
+    return hashlib.sha1(repr(signature[1:]).encode()).hexdigest()[:16]
+
+
+def bump_version():
+    '''
+    Funzione che forza l'invalidazione della copia condivisa del dataset,
+    da chiamare dopo ogni scrittura sul file dei dati
+    '''
+    global _version
+    _version += 1
+    data_changed.set()
+
+
+@st.cache_resource(max_entries=1, show_spinner=False)
+def _load_data(signature):
+    '''
+    Funzione che legge il file dei dati e i file del registro delle vendite.
+    Il file Arrow viene mappato in memoria, quindi la lettura non copia i dati e le pagine
+    del file sono condivise tra i processi dalla cache del sistema operativo.
+    Il risultato è condiviso tra tutte le sessioni, mantenendo in memoria solo
+    l'ultima versione (max_entries=1)
+
+    PARAM
+        tuple: firma del dataset, l'ultimo elemento contiene i file delle vendite da leggere
+    RETURN
+        dataframe: dataframe dei dati
+    '''
+    frames = [pl.read_ipc(data_file)]
+    frames += [pl.read_ipc(sales_dir/name) for name in signature[-1]]
+    # rechunk=False: il file principale resta mappato in memoria senza essere copiato
+    return pl.concat(frames, rechunk=False)
+
+
+def _read_sales(names):
+    '''
+    Funzione che legge solo i file del registro delle vendite passati come parametro
+
+    PARAM
+        list: nomi dei file delle vendite
+    RETURN
+        dataframe: righe delle vendite
+    '''
+    return pl.concat([pl.read_ipc(sales_dir/name) for name in names])
+
+
+def read_lock():
+    '''
+    Context manager che acquisisce il lock condiviso di lettura: impedisce che una
+    compattazione sostituisca il file principale o cancelli i file delle vendite
+    mentre vengono letti
+
+    RETURN
+        context manager del lock condiviso
+    '''
+    return _file_lock(data_lock_file)
+
+
+def scan_data(signature):
+    '''
+    Funzione che ritorna il dataset come LazyFrame, senza leggere i dati.
+    Le query costruite sul LazyFrame leggono dai file solo le colonne e le righe necessarie.
+    La query va eseguita mentre si tiene read_lock(), con la firma letta sotto lo stesso lock
+
+    PARAM
+        tuple: firma del dataset, l'ultimo elemento contiene i file delle vendite da leggere
+    RETURN
+        lazyframe: piano di lettura del dataset
+    '''
+    frames = [pl.scan_ipc(data_file)]
+    frames += [pl.scan_ipc(sales_dir/name) for name in signature[-1]]
+    return pl.concat(frames)
+
+
+def data_schema():
+    '''
+    Funzione che ritorna lo schema del dataset leggendo solo l'intestazione del file Arrow
+
+    RETURN
+        dict: nome della colonna -> tipo polars
+    '''
+    if not data_file.exists():
+        convert_csv()
+    return pl.read_ipc_schema(data_file)
+
+
+class IncrementalIndex:
+    '''
+    Classe base per le strutture derivate dal dataset (indici, aggregati) che vengono
+    costruite una volta per versione del dataset e poi aggiornate in modo incrementale.
+    Le sottoclassi implementano:
+    - build(data): costruzione della struttura a partire da tutto il dataset
+    - update(rows): aggiornamento della struttura con le sole righe delle nuove vendite
+    e possono ridefinire load(signature) per costruire la struttura in altro modo
+    (ad esempio leggendola da un file già salvato)
+    I metodi di lettura delle sottoclassi devono usare self.lock, perché la stessa
+    istanza è condivisa tra le sessioni
+    '''
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        # un solo aggiornamento alla volta, le letture usano solo self.lock
+        self.refresh_lock = threading.Lock()
+        self.signature = None
+
+    def build(self, data):
+        raise NotImplementedError
+
+    def update(self, rows):
+        raise NotImplementedError
+
+    def load(self, signature):
+        '''
+        Funzione che costruisce la struttura per la versione del dataset passata come parametro
+
+        PARAM
+            tuple: firma del dataset
+        '''
+        self.build(_load_data(signature))
+
+    def refresh(self):
+        '''
+        Funzione che allinea la struttura all'ultima versione del dataset:
+        - se è cambiato il file principale (compattazione, conversione o bump_version())
+          la struttura viene ricostruita da zero su una copia, che poi sostituisce lo stato
+          attuale in un colpo solo: le letture non aspettano la ricostruzione
+        - se sono state aggiunte solo nuove vendite vengono lette e applicate solo quelle
+        Se un altro thread (ad esempio quello di precalcolo) sta già aggiornando la struttura,
+        viene ritornata subito la versione precedente, tranne alla prima costruzione
+
+        RETURN
+            IncrementalIndex: l'istanza stessa, aggiornata
+        '''
+        if not self.refresh_lock.acquire(blocking=self.signature is None):
+            return self
+        try:
+            with read_lock():
+                signature = data_signature()
+                if signature == self.signature:
+                    return self
+
+                applied = set(self.signature[-1]) if self.signature is not None else None
+                if applied is not None and signature[:-1] == self.signature[:-1] \
+                        and applied.issubset(signature[-1]):
+                    new_sales = [name for name in signature[-1] if name not in applied]
+                    rows = _read_sales(new_sales)
+                    with self.lock:
+                        self.update(rows)
+                        self.signature = signature
+                else:
+                    state = copy.copy(self)
+                    state.load(signature)
+                    with self.lock:
+                        vars(self).update(vars(state))
+                        self.signature = signature
+        finally:
+            self.refresh_lock.release()
+        return self
+
+
+def _derived_file(name, signature):
+    return derived_dir/f'{name}-{data_version(signature)}.arrow'
+
+
+def read_derived(name, signature):
+    '''
+    Funzione che legge una tabella derivata salvata per la versione del dataset passata come parametro.
+    Il file viene mappato in memoria
+
+    PARAM
+        string: nome della tabella
+        tuple: firma del dataset
+    RETURN
+        dataframe: tabella derivata, None se non è stata salvata per questa versione
+    '''
+    try:
+        return pl.read_ipc(_derived_file(name, signature))
+    except FileNotFoundError:
+        return None
+
+
+def write_derived(name, signature, data):
+    '''
+    Funzione che salva una tabella derivata per la versione del dataset passata come parametro
+    e cancella le versioni più vecchie della stessa tabella, tenendo le ultime derived_versions.
+    I processi che hanno già mappato in memoria un file cancellato continuano a leggerlo
+
+    PARAM
+        string: nome della tabella
+        tuple: firma del dataset
+        dataframe: tabella derivata
+    '''
+    target = _derived_file(name, signature)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    _write_atomic(data, target)
+
+    versions = []
+    for path in derived_dir.glob(f'{name}-*.arrow'):
+        # il nome di una tabella può essere il prefisso di un'altra (totals-make, totals-make-range)
+        if path.stem.rpartition('-')[0] != name:
+            continue
+        try:
+            versions.append((path.stat().st_mtime_ns, path))
+        except FileNotFoundError:
+            continue
+    versions.sort(reverse=True)
+    for _, path in versions[derived_versions:]:
+        if path != target:
+            path.unlink(missing_ok=True)
+
+
+def derived(names, signature, compute):
+    '''
+    Funzione che ritorna le tabelle derivate per la versione del dataset passata come parametro,
+    mappate in memoria dai file di DATA/derived. Le tabelle che non sono ancora state salvate
+    vengono calcolate insieme, salvate e poi rilette dai file, così anche il processo che le ha
+    calcolate non ne tiene una copia privata
+
+    PARAM
+        list: nomi delle tabelle
+        tuple: firma del dataset
+        function: funzione che riceve la lista dei nomi mancanti e ritorna le tabelle nello stesso ordine
+    RETURN
+        dict: nome -> tabella derivata
+    '''
+    tables = {name: read_derived(name, signature) for name in names}
+    missing = [name for name, table in tables.items() if table is None]
+    if missing:
+        for name, table in zip(missing, compute(missing)):
+            write_derived(name, signature, table)
+            tables[name] = read_derived(name, signature)
+            # il file può essere già stato cancellato da un altro processo con versioni più nuove
+            if tables[name] is None:
+                tables[name] = table
+    return tables
+
+
+def append_data(rows):
+    '''
+    Funzione che aggiunge nuove righe al registro delle vendite, senza riscrivere il dataset.
+    Ogni chiamata crea un nuovo file con nome univoco, quindi più venditori possono
+    aggiungere vendite contemporaneamente senza sovrascriversi.
+    Superata la soglia di compact_threshold vendite viene avviata la compattazione
+    in un thread separato
+
+    PARAM
+        dataframe: righe da aggiungere, con lo stesso schema del dataset
+    '''
+    sales_dir.mkdir(parents=True, exist_ok=True)
+    # la nuova vendita cambia la lista dei file del registro, e quindi la firma del dataset
+    _write_atomic(rows, sales_dir/f'{time.time_ns():020d}-{uuid.uuid4().hex}.arrow')
+    data_changed.set()
+
+    if len(_sale_files()) >= compact_threshold:
+        threading.Thread(target=compact, daemon=True).start()
+
+
+def compact():
+    '''
+    Funzione che compatta le vendite del registro nel file principale:
+    - Un solo processo alla volta può compattare, le altre chiamate terminano subito
+    - Il nuovo file principale viene scritto su un file temporaneo, senza bloccare lettori
+      e venditori
+    - La sostituzione del file principale e la cancellazione delle sole vendite compattate
+      avvengono con il lock esclusivo, quindi nessun lettore vede le vendite due volte.
+      Le vendite aggiunte durante la compattazione restano nel registro
+
+    RETURN
+        int: numero di vendite compattate
+    '''
+    with _file_lock(compact_lock_file, exclusive=True, blocking=False) as acquired:
+        if not acquired:
+            return 0
+        return _compact()
+
+
+def _compact():
+    # da chiamare con il lock esclusivo di compact_lock_file
+    names = _sale_files()
+    if not names:
+        return 0
+
+    frames = [pl.read_ipc(data_file)]
+    frames += [pl.read_ipc(sales_dir/name) for name in names]
+    tmp = data_file.with_name(f'.{data_file.name}.{uuid.uuid4().hex}.tmp')
+    pl.concat(frames).write_ipc(tmp, compression='uncompressed')
+
+    with _file_lock(data_lock_file, exclusive=True):
+        os.replace(tmp, data_file)
+        for name in names:
+            (sales_dir/name).unlink()
+
+    bump_version()
+    return len(names)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Conversione del dataset tra csv e Arrow IPC')
+    parser.add_argument('--export', action='store_true',
+                        help='esporta DATA/data.arrow in DATA/data.csv invece di convertirlo')
+    parser.add_argument('--compact', action='store_true',
+                        help='compatta le vendite del registro DATA/sales nel file principale')
+    args = parser.parse_args()
+
+    if args.export:
+        export_csv()
+        print(f'Dataset esportato in {csv_file}')
+    elif args.compact:
+        print(f'Compattate {compact()} vendite in {data_file}')
+    else:
+        data = convert_csv()
+        print(f'Convertite {data.height} righe in {data_file}')
@@ -3,6 +3,8 @@ from login import authentication
 from dashboard import dashboard_main
 from admin import admin_main
 from sale import sale_main
+import warmup
+import session
 
 logo_folder = 'LOGO/Logo.png'
 
@@ -54,6 +56,9 @@ def page_list(permission):
 
 if __name__ == '__main__':
     #st.set_page_config(layout='wide')
+    # Avvia (una sola volta per processo) il precalcolo delle strutture derivate dal dataset
+    warmup.start()
+
     # Inizializza lo stato di autenticazione se non esiste
     if 'user_state' not in st.session_state:
         st.session_state.user_state = {
@@ -90,4 +95,7 @@ if __name__ == '__main__':
             
         logout()
 
+        # Controllo della memoria occupata dallo stato della sessione
+        session.enforce_budget()
+
         
\ No newline at end of file
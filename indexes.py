@@ -0,0 +1,186 @@
+import streamlit as st
+import polars as pl
+import dataset
+
+'''
+Indici usati dal form della pagina di vendita.
+Ogni indice è costruito una sola volta per versione del dataset, è condiviso tra
+tutte le sessioni (st.cache_resource) e viene aggiornato in modo incrementale
+quando vengono aggiunte nuove vendite.
+'''
+
+
+class CityBounds(dataset.IncrementalIndex):
+    '''
+    Indice che associa ad ogni città le coordinate limite delle vendite:
+        città -> (lon_min, lon_max, lat_min, lat_max)
+    '''
+
+    def build(self, data):
+        bounds = (
+            data
+            .group_by('City')
+            .agg(
+                pl.col('lon').min().alias('lon_min'),
+                pl.col('lon').max().alias('lon_max'),
+                pl.col('lat').min().alias('lat_min'),
+                pl.col('lat').max().alias('lat_max')
+            )
+        )
+        self.bounds = {row[0]: row[1:] for row in bounds.iter_rows()}
+
+    def update(self, rows):
+        for city, lon, lat in rows.select('City', 'lon', 'lat').iter_rows():
+            if lon is None or lat is None:
+                continue
+            old = self.bounds.get(city)
+            if old is None or old[0] is None:
+                self.bounds[city] = (lon, lon, lat, lat)
+            else:
+                self.bounds[city] = (min(old[0], lon), max(old[1], lon),
+                                     min(old[2], lat), max(old[3], lat))
+
+    def get(self, city):
+        '''
+        Funzione che ritorna le coordinate limite della città passata come parametro
+
+        PARAM
+            string: nome della città
+        RETURN
+            tuple: (lon_min, lon_max, lat_min, lat_max), None se la città non è presente
+        '''
+        with self.lock:
+            return self.bounds.get(city)
+
+
+@st.cache_resource(show_spinner=False)
+def _city_bounds():
+    return CityBounds()
+
+
+def city_bounds():
+    '''
+    Funzione che ritorna l'indice delle coordinate limite per città, condiviso tra le sessioni
+
+    RETURN
+        CityBounds: indice aggiornato all'ultima versione del dataset
+    '''
+    return _city_bounds().refresh()
+
+
+def _add(values, value):
+    '''
+    Funzione che aggiunge un valore ad una tupla ordinata, se non è già presente
+
+    PARAM
+        tuple: tupla ordinata
+        value: valore da aggiungere
+    RETURN
+        tuple: tupla ordinata con il nuovo valore
+    '''
+    if value is None or value in values:
+        return values
+    return tuple(sorted(values + (value,)))
+
+
+class SaleLookup(dataset.IncrementalIndex):
+    '''
+    Indice gerarchico delle scelte del form di vendita:
+        contea -> città -> stato
+        produttore -> modello -> tipologia del motore
+        tipologia del motore -> autonomia massima
+        anni dei modelli
+    Le liste di scelte sono salvate come tuple già ordinate, quindi ogni interazione
+    con il form è una semplice lettura da dizionario.
+    '''
+
+    def build(self, data):
+        cities = {}
+        models = {}
+        engine_types = {}
+        self.states = {}
+
+        location = data.select('County', 'City', 'State').unique().drop_nulls()
+        for county, city, state in location.iter_rows():
+            cities.setdefault(county, set()).add(city)
+            self.states.setdefault(city, state)
+
+        vehicle = data.select('Make', 'Model', 'Electric Vehicle Type').unique().drop_nulls()
+        for make, model, engine_type in vehicle.iter_rows():
+            models.setdefault(make, set()).add(model)
+            engine_types.setdefault((make, model), set()).add(engine_type)
+
+        ranges = data.group_by('Electric Vehicle Type').agg(pl.col('Electric Range').max()).drop_nulls()
+
+        self.cities = {county: tuple(sorted(values)) for county, values in cities.items()}
+        self.models = {make: tuple(sorted(values)) for make, values in models.items()}
+        self.engine_types = {key: tuple(sorted(values)) for key, values in engine_types.items()}
+        self.max_ranges = dict(ranges.iter_rows())
+        self.counties = tuple(sorted(self.cities))
+        self.makes = tuple(sorted(self.models))
+        self.years = tuple(data['Model Year'].drop_nulls().unique().sort().to_list())
+
+    def update(self, rows):
+        for row in rows.iter_rows(named=True):
+            county, city = row['County'], row['City']
+            make, model = row['Make'], row['Model']
+            engine_type, electric_range = row['Electric Vehicle Type'], row['Electric Range']
+
+            self.counties = _add(self.counties, county)
+            self.cities[county] = _add(self.cities.get(county, ()), city)
+            self.states.setdefault(city, row['State'])
+
+            self.makes = _add(self.makes, make)
+            self.models[make] = _add(self.models.get(make, ()), model)
+            self.engine_types[make, model] = _add(self.engine_types.get((make, model), ()), engine_type)
+            self.years = _add(self.years, row['Model Year'])
+
+            if electric_range is not None:
+                self.max_ranges[engine_type] = max(self.max_ranges.get(engine_type, electric_range), electric_range)
+
+    def county_list(self):
+        with self.lock:
+            return self.counties
+
+    def city_list(self, county):
+        with self.lock:
+            return self.cities.get(county, ())
+
+    def state(self, city):
+        with self.lock:
+            return self.states.get(city)
+
+    def make_list(self):
+        with self.lock:
+            return self.makes
+
+    def model_list(self, make):
+        with self.lock:
+            return self.models.get(make, ())
+
+    def year_list(self):
+        with self.lock:
+            return self.years
+
+    def engine_type_list(self, make, model):
+        with self.lock:
+            return self.engine_types.get((make, model), ())
+
+    def max_range(self, engine_type):
+        with self.lock:
+            return self.max_ranges.get(engine_type)
+
+
+@st.cache_resource(show_spinner=False)
+def _sale_lookup():
+    return SaleLookup()
+
+
+def sale_lookup():
+    '''
+    Funzione che ritorna l'indice delle scelte del form di vendita, condiviso tra le sessioni
+
+    RETURN
+        SaleLookup: indice aggiornato all'ultima versione del dataset
+    '''
+    return _sale_lookup().refresh()
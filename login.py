@@ -1,42 +1,28 @@
 import streamlit as st
 import sqlite3
 import time
-import smtplib 
-from email.mime.text import MIMEText
 from random import randrange
-import hashlib
-from pathlib import Path
+import database
+import passwords
+import mailer
 
 '''
-Gestisce il processo di estrazione degli utenti presenti nel database:
-- Viene creato un dizionario che conterrà la mail e le rispettive 
-  password e permessi
-- Avviene il colegamento al database
-- Viene creata la select
-- Viene riempito il dizionario
-
+Gestisce il processo di estrazione di un utente presente nel database:
+- La mail viene normalizzata (minuscole, senza spazi)
+- Viene letto solo l'utente con quella mail, usando l'indice univoco della mail
+- Le ricerche recenti sono condivise tra le sessioni per pochi secondi
+Param:
+    Mail: e-mail dell'utente
 Returns:
-    dict_mail_pass: dict, contiente come chiavi le e-mail degli utenti, con 
-                    con le rispettive password e permessi dell'utente.
+    dict: password e permessi dell'utente, None se la mail non è registrata
 '''
-def user_list():
-    dict_mail_pass = {}
-    db_dir = Path('DATABASE')
-    db = sqlite3.connect(db_dir/'user.db')
-    cursor = db.cursor()
-    cursor.execute("SELECT Mail, Password, User_Type, Name_Surname  FROM USER")
-    rows = cursor.fetchall()
-    
-    for row in rows:
-        dict_mail_pass[row[0]] = {'password': row[1], 'user_type': row[2], 'username': row[3]}
-    
-    return dict_mail_pass
+def user_info(Mail):
+    return database.find_user(Mail)
 
 '''
 Gestisce il processo di aggiunta di un nuovo utente sul database:
-- Viene creato l'insert
-- Si collega al database
-- La password viene Hashata con sha256
+- Viene eseguito l'insert con una connessione del pool
+- La password viene hashata con sale (passwords.hash_password)
 Param: 
     Mail: e-mail del nuovo utente
     Username: nome e cognome del nuovo utente
@@ -47,49 +33,43 @@ Return:
              False altrimenti
 '''
 def add_user(Mail, Username, User_type, Password):
-    sql_insert = '''INSERT INTO USER(Mail, Name_Surname, User_Type, Password) 
-                    VALUES (?, ?, ?, ?)'''
-    db_dir = Path('DATABASE')
-    db = sqlite3.connect(db_dir/'user.db')
-    cursor = db.cursor()
-    
     try:
-        cursor.execute(sql_insert, (Mail, Username, User_type, hashlib.sha256(Password.encode('utf-8')).hexdigest()))
-        db.commit()
+        database.execute(database.INSERT_USER,
+                         (Mail, Username, User_type, passwords.hash_password(Password)))
     except sqlite3.Error as e:
         st.error(f"Errore nel database: {e}")
         return False
-    finally:
-        db.close()
+    except TimeoutError:
+        # il pool che calcola gli hash è saturo
+        st.error("Server occupato, riprova tra qualche secondo")
+        return False
     return True
 
 '''
 Gesisce il cambio di password di un utente del database:
-- Viene creata la funzione di update
-- Avviene il collegamento al database
-- La password viene hashata con sha256
+- Viene eseguito l'update con una connessione del pool
+- La password viene hashata con sale (passwords.hash_password)
 Param: 
     Mail: mail dell'utente
     Passoword: password dell'utente
 Returns: 
     boolean: True se avviene correttamente la modifica sul database, 
-             False altrimenti.
+             False altrimenti (anche se la mail non è registrata).
 '''
 def change_password(Mail, Password):
 
-    sql_update = '''UPDATE USER SET Password = ? WHERE Mail = ?'''
-    db_dir = Path('DATABASE')
-    db = sqlite3.connect(db_dir/'user.db')
-    cursor = db.cursor()
-
     try: 
-        cursor.execute(sql_update, (hashlib.sha256(Password.encode('utf-8')).hexdigest(), Mail))
-        db.commit()
+        updated = database.execute(database.UPDATE_PASSWORD, (passwords.hash_password(Password), Mail))
     except sqlite3.Error as e:
         st.error(f"Errore nel database: {e}")
         return False
-    finally:
-        db.close()
+    except TimeoutError:
+        # il pool che calcola gli hash è saturo
+        st.error("Server occupato, riprova tra qualche secondo")
+        return False
+    if updated == 0:
+        st.error("Utente non trovato")
+        return False
     return True
 
 """
@@ -105,7 +85,6 @@ def authentication():
     '''
     Inizializzazione degli session_state:
     -user_state: inizializza gli stati dell'utente
-    -user_list: inizializza un dizionario che ha come chiave 'mail' dell'utente
     -widget_key: sessione che mi permette di resettare per tornare alla pagina di login
     '''
     if 'user_state' not in st.session_state:
@@ -116,9 +95,6 @@ def authentication():
             'logged_in': False
         }
     
-    if 'users_list' not in st.session_state:
-        st.session_state.users_list = user_list()
-
     if 'widget_key' not in st.session_state:
         st.session_state.widget_key = 0
 
@@ -135,12 +111,9 @@ def authentication():
     Condizioni che servono per eseguire l'azione scelta dall'utente
     '''
     if option == 'Login':
-        #st.write(st.session_state.users_list)
         container = st.container(border=True)
         st.session_state.user_state['mail'] = container.text_input('E-Mail')
         password = container.text_input('Password', type='password')
-        #container.write(st.session_state.user_state['mail'].lower())
-        #st.write(st.session_state.users_list)
         submit = st.button('Login')
 
         if 'submitted' not in st.session_state:
@@ -149,13 +122,23 @@ def authentication():
         if submit:
             st.session_state.submitted = True
 
-        # Verifica che la mail sia presente del DB e che la password hashata coincida con password DB
+        # Verifica che la mail sia presente del DB e che la password coincida con l'hash del DB
         if st.session_state.submitted:
-            if st.session_state.user_state['mail'].lower() in st.session_state.users_list and \
-            hashlib.sha256(password.encode('utf-8')).hexdigest() == st.session_state.users_list[st.session_state.user_state['mail'].lower()]['password']:
+            mail = database.normalize_mail(st.session_state.user_state['mail'])
+            user = user_info(mail)
+            try:
+                valid = user is not None and passwords.verify_password(password, user['password'])
+            except TimeoutError:
+                # il pool che calcola gli hash è saturo
+                st.error("Server occupato, riprova tra qualche secondo")
+                return False
+            if valid:
+                # Le password salvate con un hash obsoleto vengono risalvate con quello attuale
+                if passwords.needs_rehash(user['password']):
+                    change_password(mail, password)
                 #st.session_state.authenticated = True
-                st.session_state.user_state['user_type'] = st.session_state.users_list[st.session_state.user_state['mail'].lower()]['user_type']
-                st.session_state.user_state['username'] = st.session_state.users_list[st.session_state.user_state['mail'].lower()]['username']
+                st.session_state.user_state['user_type'] = user['user_type']
+                st.session_state.user_state['username'] = user['username']
                 st.session_state.user_state['logged_in'] = True
                 st.success('Login successful!')
                 return st.session_state.user_state['logged_in']
@@ -169,7 +152,7 @@ def authentication():
         
         # Compilazione dei campi dell'utente
         with container:
-            mail = col1.text_input('Inserisci e-mail')
+            mail = database.normalize_mail(col1.text_input('Inserisci e-mail'))
             username = col1.text_input('Inserisci nome e cognome')
             password = col2.text_input('Inserisci password', type='password')
             user_type = col2.selectbox('User Type',('Analista', 'Venditore'))
@@ -178,12 +161,9 @@ def authentication():
         # Verifica della non presenza dell'utente sul DB 
         if submit:
             if mail and username and password:
-                if mail not in st.session_state.users_list:
-                    if add_user(mail.lower(), username.lower(), user_type, password):
+                if user_info(mail) is None:
+                    if add_user(mail, username.lower(), user_type, password):
                         st.success("Registrazione completata! Verrai indirizzato al login.")
-
-                        # Aggiorno il dizionario degli utenti una volta inserito il nuovo utente
-                        st.session_state.users_list = user_list()
                         time.sleep(4)
                         st.session_state.widget_key += 1  # Incrementa la key
 
@@ -196,7 +176,8 @@ def authentication():
     # Forgot Passowrd
     else:  
         container = st.container(border=True)
-        email_recovery = container.text_input('Inserisci la tua email')
+        # la mail normalizzata è usata sia per la ricerca che per l'invio e il cambio della password
+        email_recovery = database.normalize_mail(container.text_input('Inserisci la tua email'))
         submit = st.button('Recupera Password')
         
         # Inizializzazione delle variabili di sessione
@@ -211,13 +192,11 @@ def authentication():
 
         # Gestione dell'invio email
         if submit:
-            if email_recovery in st.session_state.users_list:
+            if user_info(email_recovery) is not None:
                 st.session_state.check_user = True
                 
                 #campi della mail e invio messaggio
-                email_send = 'gobbo.progetto.sistemi@gmail.com'
                 subject = 'Codice di verifica ALESSANDRO GOBBO'
-                password_app = 'rrin kfau fdai tqyh'
                 verify_number = randrange(100000, 999999)  # Codice a 6 cifre
                 
                 st.session_state.verify_number = verify_number
@@ -226,20 +205,11 @@ def authentication():
                 Inserisci questo codice per completare il processo di recupero password.
                 """
                 
-                try:
-                    msg = MIMEText(message)
-                    msg['From'] = email_send
-                    msg['To'] = email_recovery
-                    msg['Subject'] = subject
-
-                    server = smtplib.SMTP('smtp.gmail.com', 587)
-                    server.starttls()
-                    server.login(email_send, password_app)
-                    server.sendmail(email_send, email_recovery, msg.as_string())
-                    server.quit()
+                # La mail viene inviata in background dalla coda delle mail
+                if mailer.send_mail(email_recovery, subject, message):
                     st.success("Email inviata con successo!")
-                except Exception as e:
-                    st.error(f"Errore invio della mail : {e}")
+                else:
+                    st.error("Errore invio della mail, riprova tra qualche minuto")
             else:
                 st.error("Email non trovata")
             
@@ -272,7 +242,6 @@ def authentication():
                             st.session_state.check_user = False
                             st.session_state.code_verified = False
                             del st.session_state.submitted
-                            st.session_state.users_list = user_list()
                             time.sleep(2)
                             st.session_state.widget_key += 1
                             st.rerun()
@@ -0,0 +1,181 @@
+import streamlit as st
+import logging
+import os
+import queue
+import smtplib
+import threading
+import time
+from email.mime.text import MIMEText
+
+'''
+Invio delle mail dell'applicazione (codice di recupero della password).
+- Le mail vengono messe in una coda e inviate da un thread in background, quindi la pagina
+  non aspetta la rete
+- La connessione SMTP (STARTTLS e login) viene aperta alla prima mail e riusata per le
+  successive, e chiusa dopo idle_timeout secondi senza mail
+- Un invio fallito viene ritentato fino a retries volte, con attesa crescente (backoff)
+- Il trasporto si sceglie con la variabile d'ambiente EV_MAIL_TRANSPORT:
+  'smtp' (default) invia con il server SMTP, 'debug' tiene le mail in memoria e le stampa,
+  da usare in locale e nei test
+- Le credenziali del server SMTP si leggono dalle variabili d'ambiente EV_SMTP_USER
+  (usata anche come mittente) e EV_SMTP_PASSWORD, server e porta da EV_SMTP_HOST e EV_SMTP_PORT
+'''
+
+smtp_host = os.environ.get('EV_SMTP_HOST', 'smtp.gmail.com')
+smtp_port = int(os.environ.get('EV_SMTP_PORT', 587))
+smtp_user = os.environ.get('EV_SMTP_USER', '')
+smtp_password = os.environ.get('EV_SMTP_PASSWORD', '')
+
+# Numero massimo di mail in attesa di invio
+queue_size = 100
+# Numero di tentativi di invio dopo il primo
+retries = 3
+# Secondi di attesa prima del primo nuovo tentativo, raddoppiati a ogni tentativo
+backoff = 1
+# Secondi senza mail dopo i quali la connessione SMTP viene chiusa
+idle_timeout = 60
+
+logger = logging.getLogger(__name__)
+
+
+class SmtpTransport:
+    '''
+    Trasporto che invia le mail con il server SMTP, riusando la stessa connessione
+    '''
+
+    def __init__(self, host=smtp_host, port=smtp_port, user=smtp_user, password=smtp_password):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.server = None
+
+    def _connect(self):
+        if not self.user or not self.password:
+            raise smtplib.SMTPAuthenticationError(0, 'EV_SMTP_USER e EV_SMTP_PASSWORD non sono impostate')
+        server = smtplib.SMTP(self.host, self.port, timeout=30)
+        server.starttls()
+        server.login(self.user, self.password)
+        return server
+
+    def send(self, msg):
+        if self.server is None:
+            self.server = self._connect()
+        try:
+            self.server.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            # il server ha chiuso la connessione inattiva: nuova connessione e nuovo tentativo
+            self.server = self._connect()
+            self.server.send_message(msg)
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        self.server = None
+
+
+class DebugTransport:
+    '''
+    Trasporto che non usa la rete: le mail inviate restano nella lista sent e vengono stampate
+    '''
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, msg):
+        self.sent.append(msg)
+        print(f"Mail per {msg['To']}: {msg['Subject']}\n{msg.get_payload(decode=True).decode(msg.get_content_charset() or 'utf-8')}")
+
+    def close(self):
+        pass
+
+
+transports = {'smtp': SmtpTransport, 'debug': DebugTransport}
+
+
+class Mailer:
+    '''
+    Coda delle mail da inviare con il thread che le invia una alla volta con il trasporto scelto
+    '''
+
+    def __init__(self, transport):
+        self.transport = transport
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = threading.Thread(target=self._run, name='mailer', daemon=True)
+        self.thread.start()
+
+    def send(self, to, subject, body):
+        '''
+        Funzione che mette una mail nella coda di invio, senza aspettare l'invio
+
+        PARAM
+            string: destinatario
+            string: oggetto
+            string: testo della mail
+        RETURN
+            boolean: True se la mail è in coda, False se la coda è piena
+        '''
+        msg = MIMEText(body)
+        msg['From'] = smtp_user
+        msg['To'] = to
+        msg['Subject'] = subject
+        try:
+            self.queue.put_nowait(msg)
+        except queue.Full:
+            return False
+        return True
+
+    def _deliver(self, msg):
+        for attempt in range(retries + 1):
+            try:
+                self.transport.send(msg)
+                return True
+            except Exception:
+                logger.exception('Errore invio della mail a %s (tentativo %d)', msg['To'], attempt + 1)
+                if attempt < retries:
+                    time.sleep(backoff*2**attempt)
+        return False
+
+    def _run(self):
+        while True:
+            try:
+                msg = self.queue.get(timeout=idle_timeout)
+            except queue.Empty:
+                self.transport.close()
+                continue
+            try:
+                self._deliver(msg)
+            finally:
+                self.queue.task_done()
+
+
+@st.cache_resource(show_spinner=False)
+def mailer():
+    '''
+    Funzione che ritorna la coda delle mail del processo, con il trasporto scelto da EV_MAIL_TRANSPORT
+
+    RETURN
+        Mailer: coda delle mail
+    '''
+    return Mailer(transports[os.environ.get('EV_MAIL_TRANSPORT', 'smtp')]())
+
+
+def send_mail(to, subject, body):
+    '''
+    Funzione che invia una mail in background
+
+    PARAM
+        string: destinatario
+        string: oggetto
+        string: testo della mail
+    RETURN
+        boolean: True se la mail è stata messa in coda, False altrimenti
+    '''
+    return mailer().send(to, subject, body)
@@ -0,0 +1,222 @@
+import streamlit as st
+import argparse
+import base64
+import binascii
+import hashlib
+import hmac
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+'''
+Hash delle password degli utenti.
+- Le password vengono salvate con una funzione di derivazione lenta e con sale casuale
+  (scrypt di default, oppure PBKDF2-SHA256), nel formato 'schema$parametri$sale$hash'
+- Il costo di ogni schema è configurabile: le password salvate con parametri diversi da quelli
+  attuali (o con il vecchio sha256 senza sale, 64 caratteri esadecimali) vengono verificate
+  con i loro parametri e poi risalvate con quelli attuali al primo login riuscito
+- Il calcolo degli hash avviene in un pool di thread limitato (hash_workers), così molti login
+  contemporanei non occupano più CPU e memoria del previsto: le richieste in più aspettano in coda
+  e, se l'hash non è pronto entro hash_timeout secondi, viene sollevato TimeoutError
+
+Con 'python passwords.py' si misura la latenza del login al variare della concorrenza.
+'''
+
+# Schema usato per le nuove password
+default_scheme = 'scrypt'
+# Costo di scrypt: memoria usata 128*n*r byte per hash (16 MB con i valori di default)
+scrypt_n = 2**14
+scrypt_r = 8
+scrypt_p = 1
+# Numero di iterazioni di PBKDF2-SHA256
+pbkdf2_iterations = 600000
+# Lunghezza del sale e dell'hash in byte
+salt_bytes = 16
+hash_bytes = 32
+# Numero di thread che calcolano gli hash
+hash_workers = 4
+# Secondi di attesa massima di un hash (coda compresa)
+hash_timeout = 30
+
+
+def _b64(data):
+    return base64.b64encode(data).decode('ascii')
+
+
+def _unb64(text):
+    return base64.b64decode(text.encode('ascii'))
+
+
+class ScryptHasher:
+    '''
+    Hash scrypt, formato 'scrypt$n$r$p$sale$hash'
+    '''
+    name = 'scrypt'
+
+    def params(self):
+        return (scrypt_n, scrypt_r, scrypt_p)
+
+    def derive(self, password, salt, params):
+        n, r, p = params
+        return hashlib.scrypt(password.encode('utf-8'), salt=salt, n=n, r=r, p=p,
+                              maxmem=256*n*r*p + 2**20, dklen=hash_bytes)
+
+    def parse(self, fields):
+        n, r, p = (int(field) for field in fields)
+        return (n, r, p)
+
+
+class Pbkdf2Hasher:
+    '''
+    Hash PBKDF2-SHA256, formato 'pbkdf2_sha256$iterazioni$sale$hash'
+    '''
+    name = 'pbkdf2_sha256'
+
+    def params(self):
+        return (pbkdf2_iterations,)
+
+    def derive(self, password, salt, params):
+        return hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, params[0], dklen=hash_bytes)
+
+    def parse(self, fields):
+        return (int(fields[0]),)
+
+
+hashers = {hasher.name: hasher for hasher in (ScryptHasher(), Pbkdf2Hasher())}
+
+
+def _is_legacy(encoded):
+    # vecchio formato: sha256 della password senza sale, in esadecimale
+    return len(encoded) == 64 and all(c in '0123456789abcdef' for c in encoded)
+
+
+def _hash(password, scheme):
+    hasher = hashers[scheme]
+    salt = os.urandom(salt_bytes)
+    params = hasher.params()
+    digest = hasher.derive(password, salt, params)
+    return '$'.join([hasher.name, *map(str, params), _b64(salt), _b64(digest)])
+
+
+def _verify(password, encoded):
+    if _is_legacy(encoded):
+        return hmac.compare_digest(hashlib.sha256(password.encode('utf-8')).hexdigest(), encoded)
+    name, *fields = encoded.split('$')
+    hasher = hashers.get(name)
+    if hasher is None:
+        return False
+    try:
+        params = hasher.parse(fields[:-2])
+        digest = hasher.derive(password, _unb64(fields[-2]), params)
+        return hmac.compare_digest(digest, _unb64(fields[-1]))
+    except (ValueError, binascii.Error):
+        # hash salvato non valido: parametri mancanti o non numerici, sale o hash non in base64
+        return False
+
+
+@st.cache_resource(show_spinner=False)
+def executor():
+    '''
+    Funzione che ritorna il pool di thread che calcola gli hash, uno per processo
+
+    RETURN
+        ThreadPoolExecutor: pool di thread
+    '''
+    return ThreadPoolExecutor(max_workers=hash_workers, thread_name_prefix='password')
+
+
+def hash_password(password, scheme=None):
+    '''
+    Funzione che calcola l'hash della password da salvare nel database
+
+    PARAM
+        string: password in chiaro
+        string: schema da usare (default_scheme se None)
+    RETURN
+        string: hash con schema, parametri e sale
+    '''
+    return executor().submit(_hash, password, scheme or default_scheme).result(timeout=hash_timeout)
+
+
+def verify_password(password, encoded):
+    '''
+    Funzione che controlla la password con l'hash salvato, di qualunque schema
+
+    PARAM
+        string: password in chiaro
+        string: hash salvato nel database
+    RETURN
+        boolean: True se la password è corretta, False altrimenti
+    '''
+    return executor().submit(_verify, password, encoded).result(timeout=hash_timeout)
+
+
+def needs_rehash(encoded):
+    '''
+    Funzione che controlla se l'hash salvato va ricalcolato con lo schema e i costi attuali
+
+    PARAM
+        string: hash salvato nel database
+    RETURN
+        boolean: True se l'hash è obsoleto
+    '''
+    if _is_legacy(encoded):
+        return True
+    name, *fields = encoded.split('$')
+    hasher = hashers[default_scheme]
+    return name != hasher.name or hasher.parse(fields[:-2]) != hasher.params()
+
+
+def benchmark(concurrency, logins, scheme):
+    '''
+    Funzione che misura la latenza di logins verifiche di password lanciate da concurrency utenti insieme
+
+    PARAM
+        int: numero di login contemporanei
+        int: numero totale di login
+        string: schema delle password
+    RETURN
+        dict: latenza mediana, 95° percentile e login al secondo
+    '''
+    encoded = hash_password('password', scheme)
+
+    def login(_):
+        start = time.perf_counter()
+        verify_password('password', encoded)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as users:
+        latencies = sorted(users.map(login, range(logins)))
+    elapsed = time.perf_counter() - start
+    return {
+        'p50': statistics.median(latencies),
+        'p95': latencies[int(0.95*(len(latencies) - 1))],
+        'per_second': logins/elapsed,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark della latenza del login')
+    parser.add_argument('--scheme', choices=sorted(hashers), default=default_scheme,
+                        help='schema delle password')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16],
+                        help='numero di login contemporanei')
+    parser.add_argument('--logins', type=int, default=64, help='numero di login per misura')
+    parser.add_argument('--workers', type=int, default=hash_workers,
+                        help='thread del pool che calcola gli hash')
+    parser.add_argument('--scrypt-n', type=int, default=scrypt_n, help='costo di scrypt')
+    parser.add_argument('--iterations', type=int, default=pbkdf2_iterations,
+                        help='iterazioni di PBKDF2')
+    args = parser.parse_args()
+
+    hash_workers = args.workers
+    scrypt_n = args.scrypt_n
+    pbkdf2_iterations = args.iterations
+
+    for concurrency in args.concurrency:
+        result = benchmark(concurrency, args.logins, args.scheme)
+        print(f"{args.scheme} concorrenza {concurrency:3d}: "
+              f"p50 {result['p50']*1000:7.1f} ms  p95 {result['p95']*1000:7.1f} ms  "
+              f"{result['per_second']:6.1f} login/s")
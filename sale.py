@@ -1,76 +1,43 @@
 import streamlit as st
 import polars as pl
-from pathlib import Path
-import re
 import time
+import dataset
+import indexes
 
 
-def read_data():
-    '''
-    Funzione che legge i dati del file csv del percorso: DATA/data.csv
-
-    RETURN
-        dataframe: dataframe dei dati
-    '''
-    data_dir = Path('DATA')
-    data = pl.read_csv(data_dir/'data.csv')
-    return data
-
 def write_data(data):
     '''
-    Funzione che scrive nuovi dati sul file csv data.csv
+    Funzione che aggiunge nuove vendite al registro delle vendite (DATA/sales),
+    senza riscrivere tutto il file dei dati
 
     PARAM
-        dataframe: dati da scrivere
+        dataframe: righe delle nuove vendite
     '''
-    data_dir = Path('DATA')
-    data.write_csv(data_dir/'data.csv', separator=',')
+    dataset.append_data(data)
 
-def max_min_coord(data, city):
-    '''
-    Funzione che mi ritorna le coordinate possibili in base alle scelte fatte
+def max_min_coord(city):
     '''
-    
-    #creazione lista coordinate
-    coord_list = []
-
-    #selezione dei dati
-    data = (
-        data
-        .filter(pl.col('City') == city)
-        .select(pl.col('Vehicle Location'))
-    )
+    Funzione che mi ritorna le coordinate possibili in base alle scelte fatte.
+    Le coordinate limite sono lette dall'indice per città, costruito una volta per
+    versione del dataset e aggiornato ad ogni nuova vendita
 
-    #riempimento lista delle coordinate
-    for row in data.rows():
-        if row[0] is not None:
-            numb = re.findall(r'-?\d+\.\d+|-?\d+', row[0])
-            coord = (float(numb[0]), float(numb[1]))
-            coord_list.append(coord)
-
-    df = pl.DataFrame(coord_list, schema=['lon', 'lat'], orient="row")
-
-    df = (
-        df
-        .select(
-            pl.col('lon').round(4).max().alias('lon_max'),
-            pl.col('lon').round(4).min().alias('lon_min'),
-            pl.col('lat').round(4).max().alias('lat_max'),
-            pl.col('lat').round(4).min().alias('lat_min')
-        )
-    )
+    PARAM
+        string: città scelta
+    RETURN
+        dataframe: coordinate massime e minime della città
+    '''
+    lon_min, lon_max, lat_min, lat_max = indexes.city_bounds().get(city)
+    df = pl.DataFrame({
+        'lon_max': [round(lon_max, 4)],
+        'lon_min': [round(lon_min, 4)],
+        'lat_max': [round(lat_max, 4)],
+        'lat_min': [round(lat_min, 4)]
+    })
     return df
 
 def sale_main():
-    # Tracciamento aggiunta dei dati
-    if 'data_was_added' not in st.session_state:
-        st.session_state.data_was_added = False
-
-    if 'current_data' not in st.session_state or st.session_state.data_was_added:
-        st.session_state.current_data = read_data()
-        st.session_state.data_was_added = False  # Reset the flag
-    
-    data = st.session_state.current_data
+    # Il form usa solo lo schema del dataset, i dati non vengono copiati nello stato della sessione
+    schema = dataset.data_schema()
 
     #Titolo della pagina
     st.markdown(f'''
@@ -153,40 +120,33 @@ def sale_main():
     
     c1 = st.container(border=True)
 
-    # Scelta dei dati
+    # Scelta dei dati, le opzioni sono lette dall'indice delle scelte del form
+    lookup = indexes.sale_lookup()
+
     st.session_state.new_sale_county = c1.selectbox(label = 'Seleziona la contea',
-                                                    options= sorted(data['County'].unique().to_list()))
+                                                    options= lookup.county_list())
     
     st.session_state.new_sale_city = c1.selectbox(label='Seleziona la città',
-                                                  options= sorted(data
-                                                                  .filter(pl.col('County') == st.session_state.new_sale_county)['City']
-                                                                  .unique().to_list()))
-    st.session_state.new_sale_state = (data
-                                       .filter(pl.col('City') == st.session_state.new_sale_city)['State']
-                                       .unique().item())
+                                                  options= lookup.city_list(st.session_state.new_sale_county))
+    st.session_state.new_sale_state = lookup.state(st.session_state.new_sale_city)
 
     st.session_state.new_sale_make = c1.selectbox(label='''Seleziona il produttore dell'auto''',
-                                                  options = sorted(data['Make'].unique().to_list()))
+                                                  options = lookup.make_list())
     
     st.session_state.new_sale_model = c1.selectbox(label = '''Seleziona il modello dell'auto''',
-                                                   options = sorted(data
-                                                                    .filter(pl.col('Make') == st.session_state.new_sale_make)['Model']
-                                                                    .unique().to_list()))
+                                                   options = lookup.model_list(st.session_state.new_sale_make))
     
     st.session_state.new_sale_year_model = c1.select_slider(label='Seleziona anno immattricolazione auto',
-                                                            options= sorted(data['Model Year']
-                                                                            .unique().to_list()))
+                                                            options= lookup.year_list())
     
     st.session_state.new_sale_engine_type = c1.selectbox(label = 'Seleziona la tipologia del motore', 
-                                                         options= (data
-                                                                   .filter(pl.col('Model') == st.session_state.new_sale_model)['Electric Vehicle Type']
-                                                                   .unique().to_list()))
+                                                         options= lookup.engine_type_list(st.session_state.new_sale_make,
+                                                                                          st.session_state.new_sale_model))
     
     st.session_state.new_sale_range = c1.slider(label='Inserire autonomia motore elettrico', 
-                                                max_value=(data
-                                                           .filter(pl.col('Electric Vehicle Type') == st.session_state.new_sale_engine_type)['Electric Range'].max()))
+                                                max_value=lookup.max_range(st.session_state.new_sale_engine_type))
 
-    st.session_state.new_sale_check_coord = max_min_coord(data, st.session_state.new_sale_city)
+    st.session_state.new_sale_check_coord = max_min_coord(st.session_state.new_sale_city)
     c1.write(f'''Coordinate limite per {st.session_state.new_sale_city}''')
     c1.write(st.session_state.new_sale_check_coord)
 
@@ -207,7 +167,7 @@ def sale_main():
     #Operazioni a seguito del button
     submit_sale = c1.button('Conferma scelte', type="primary")
     if submit_sale:
-        new_row = pl.DataFrame([dict(zip(data.columns, [
+        new_row = pl.DataFrame([dict(zip(schema, [
             st.session_state.new_sale_county,
             st.session_state.new_sale_city,
             st.session_state.new_sale_state,
@@ -217,15 +177,14 @@ def sale_main():
             st.session_state.new_sale_engine_type,
             st.session_state.new_sale_range,
             0,
-            f'POINT ({st.session_state.new_sale_longitude} {st.session_state.new_sale_latitude})'
-        ]))])
+            f'POINT ({st.session_state.new_sale_longitude} {st.session_state.new_sale_latitude})',
+            st.session_state.new_sale_longitude,
+            st.session_state.new_sale_latitude
+        ]))], schema=schema)
 
-        # Update sessio state
-        st.session_state.current_data = pl.concat([st.session_state.current_data, new_row])
-        write_data(st.session_state.current_data)
+        # Aggiunta della vendita al registro, la copia condivisa dei dati viene riletta al prossimo rerun
+        write_data(new_row)
 
-        # Flag aggiunta dati
-        st.session_state.data_was_added = True  
         c1.success('Vendita eseguita con successo')
         time.sleep(2)
         st.rerun()
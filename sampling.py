@@ -0,0 +1,58 @@
+import polars as pl
+
+'''
+Campionamento stratificato deterministico per i grafici della dashboard.
+I grafici non ricevono le singole auto ma il numero di auto per valore (ad esempio per produttore,
+autonomia e tipologia del motore): allocate calcola quanti punti disegnare per ogni valore.
+- Gli strati sono definiti dalle colonne passate, tipicamente gruppo (produttore), tipologia del
+  motore e intervallo di autonomia (range_bucket_start)
+- Ogni strato riceve punti in proporzione al numero di auto, almeno uno, così anche gli intervalli
+  rari sono rappresentati
+- I punti di uno strato sono divisi tra i suoi valori in proporzione al numero di auto
+Il risultato dipende solo dai conteggi, quindi è uguale a ogni rerun e non dipende dall'ordine
+delle righe nel file.
+'''
+
+# Ampiezza degli intervalli di autonomia usati come strati, la stessa dell'istogramma dell'autonomia
+range_bucket = 10
+
+
+def range_bucket_start(column='Electric Range'):
+    '''
+    PARAM
+        string: colonna dell'autonomia
+    RETURN
+        expr: inizio dell'intervallo di autonomia, con nome 'Range Bucket'
+    '''
+    return (pl.col(column)//range_bucket*range_bucket).alias('Range Bucket')
+
+
+def allocate(counts, strata, group, n):
+    '''
+    Funzione che calcola quanti punti disegnare per ogni valore: al massimo circa n per gruppo,
+    in proporzione al numero di auto dello strato, almeno uno per strato e tutte le auto
+    se il gruppo ne ha meno di n. I punti dello strato vanno ai suoi valori in proporzione
+    al numero di auto, il valore più frequente dello strato riceve almeno un punto
+
+    PARAM
+        dataframe: una riga per valore con la colonna 'Count' numero di auto,
+                   ordinata in modo deterministico
+        list: colonne che definiscono gli strati, devono comprendere quelle dei gruppi
+        list: colonne che definiscono i gruppi (lista vuota per un solo gruppo)
+        int: numero massimo di punti per gruppo
+    RETURN
+        dataframe: valori con almeno un punto, con la colonna 'Points' numero di punti da disegnare
+    '''
+    count = pl.col('Count')
+    stratum_count = count.sum().over(strata)
+    total = count.sum().over(group) if group else count.sum()
+    stratum_points = pl.min_horizontal(stratum_count, (stratum_count*n/total).ceil())
+    points = (stratum_points*count/stratum_count).round()
+    first = count.rank('ordinal', descending=True).over(strata) == 1
+    return (
+        counts
+        .with_columns(
+            Points = pl.when(first).then(pl.max_horizontal(points, 1)).otherwise(points).cast(pl.Int32)
+        )
+        .filter(pl.col('Points') > 0)
+    )
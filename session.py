@@ -0,0 +1,85 @@
+import streamlit as st
+import polars as pl
+import logging
+import pickle
+import sys
+
+'''
+Stato delle sessioni degli utenti.
+Il dataset e le strutture derivate sono condivisi tra tutte le sessioni (IncrementalIndex,
+tabelle di DATA/derived): una nuova vendita crea una nuova versione condivisa senza modificare
+quella letta dalle altre sessioni, quindi nello stato della sessione non va mai salvata una copia dei dati.
+Ogni sessione ha un budget di memoria misurabile (session_budget): a fine rerun viene misurata
+la dimensione dello stato e, se supera il budget, vengono eliminati i valori ricalcolati a ogni
+rerun, dal più grande. Così la memoria di ogni utente non dipende dalla dimensione del dataset.
+'''
+
+# Budget di memoria dello stato di ogni sessione in byte
+session_budget = 256*1024
+
+logger = logging.getLogger(__name__)
+
+# Chiavi dello stato ricalcolate a ogni rerun, che possono essere eliminate se si supera il budget
+recomputed_keys = {
+    'report',
+    'model_list',
+    'mean_price',
+    'range_label',
+    'jitter_make_list',
+    'new_sale_check_coord',
+}
+
+
+def value_size(value):
+    '''
+    Funzione che stima la memoria occupata da un valore dello stato della sessione.
+    I dataframe vengono contati per intero anche se sono condivisi, così un dataframe
+    salvato nello stato per errore viene sempre segnalato
+
+    PARAM
+        value: valore dello stato
+    RETURN
+        int: dimensione stimata in byte
+    '''
+    if isinstance(value, (pl.DataFrame, pl.Series)):
+        return value.estimated_size()
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(value_size(k) + value_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return sys.getsizeof(value) + sum(value_size(v) for v in value)
+    if isinstance(value, (str, bytes, int, float, bool)) or value is None:
+        return sys.getsizeof(value)
+    try:
+        return len(pickle.dumps(value))
+    except Exception:
+        return sys.getsizeof(value)
+
+
+def usage():
+    '''
+    RETURN
+        dict: chiave dello stato -> dimensione stimata in byte, dalla più grande
+    '''
+    sizes = {key: value_size(st.session_state[key]) for key in st.session_state.keys()}
+    return dict(sorted(sizes.items(), key=lambda item: item[1], reverse=True))
+
+
+def enforce_budget():
+    '''
+    Funzione che misura lo stato della sessione e, se supera session_budget, elimina i valori
+    ricalcolati a ogni rerun partendo dal più grande, finché lo stato rientra nel budget
+
+    RETURN
+        int: dimensione dello stato in byte dopo il controllo
+    '''
+    sizes = usage()
+    total = sum(sizes.values())
+    for key, size in sizes.items():
+        if total <= session_budget:
+            break
+        if key in recomputed_keys:
+            del st.session_state[key]
+            total -= size
+    if total > session_budget:
+        logger.warning('Stato della sessione oltre il budget: %d byte, chiavi più grandi %s', total, list(sizes)[:3])
+    return total
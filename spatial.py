@@ -0,0 +1,146 @@
+import streamlit as st
+import math
+import polars as pl
+import dataset
+
+'''
+Aggregazione spaziale delle coordinate delle auto per la mappa della dashboard.
+Le coordinate vengono raggruppate in celle esagonali con espressioni polars, quindi il calcolo
+è vettorizzato e al browser vengono inviati solo i centri delle celle con il numero di auto.
+Le celle sono calcolate per più livelli di dettaglio (piramide), salvati accanto al dataset,
+così la mappa carica solo il livello scelto e la sua dimensione non cresce con il dataset.
+'''
+
+# Latitudine di riferimento (stato di Washington) per la proiezione in metri
+ref_lat = 47.5
+# Metri per grado di longitudine e di latitudine alla latitudine di riferimento
+lon_meters = 111320*math.cos(math.radians(ref_lat))
+lat_meters = 110540
+
+# Livelli della piramide: livello -> raggio delle celle in metri.
+# Ogni livello dimezza il raggio del precedente
+map_levels = {1: 16000, 2: 8000, 3: 4000, 4: 2000, 5: 1000, 6: 500}
+
+
+def _cube_round(q, r):
+    '''
+    Funzione che arrotonda le coordinate assiali di un esagono all'esagono più vicino
+    (arrotondamento in coordinate cubiche)
+
+    PARAM
+        expr: coordinata q
+        expr: coordinata r
+    RETURN
+        expr, expr: coordinate q, r dell'esagono
+    '''
+    s = -q - r
+    rq, rr, rs = q.round(), r.round(), s.round()
+    dq, dr, ds = (rq - q).abs(), (rr - r).abs(), (rs - s).abs()
+    hex_q = pl.when((dq > dr) & (dq > ds)).then(-rr - rs).otherwise(rq)
+    hex_r = pl.when((dq > dr) & (dq > ds)).then(rr).when(dr > ds).then(-rq - rs).otherwise(rr)
+    return hex_q, hex_r
+
+
+def hex_bins(data, radius):
+    '''
+    Funzione che raggruppa le coordinate in celle esagonali e conta le auto di ogni cella.
+    Le coordinate vengono proiettate in metri con una proiezione equirettangolare centrata sullo
+    stato di Washington, poi ogni punto viene assegnato all'esagono (con la punta in alto) che lo contiene.
+    Funziona sia su DataFrame che su LazyFrame
+
+    PARAM
+        dataframe: coordinate 'lon' e 'lat' delle auto, senza valori nulli
+        int: raggio degli esagoni in metri
+    RETURN
+        dataframe: 'q', 'r' coordinate della cella, 'lon', 'lat' del centro della cella
+                   e 'count' numero di auto nella cella
+    '''
+    x = pl.col('lon')*lon_meters
+    y = pl.col('lat')*lat_meters
+    hex_q, hex_r = _cube_round((math.sqrt(3)/3*x - y/3)/radius, (2/3*y)/radius)
+
+    return (
+        data
+        .select(hex_q.cast(pl.Int32).alias('q'), hex_r.cast(pl.Int32).alias('r'))
+        .group_by('q', 'r')
+        .agg(pl.len().alias('count'))
+        .with_columns(
+            (radius*math.sqrt(3)*(pl.col('q') + pl.col('r')/2)/lon_meters).alias('lon'),
+            (radius*1.5*pl.col('r')/lat_meters).alias('lat')
+        )
+    )
+
+
+def _pyramid(data):
+    '''
+    Funzione che calcola le celle di tutti i livelli della piramide in un solo piano
+
+    PARAM
+        dataframe: righe del dataset
+    RETURN
+        dataframe: celle di tutti i livelli, con la colonna 'level'
+    '''
+    coord = data.lazy().select('lon', 'lat').drop_nulls()
+    plans = [
+        hex_bins(coord, radius).with_columns(pl.lit(level, dtype=pl.Int8).alias('level'))
+        for level, radius in map_levels.items()
+    ]
+    return pl.concat(pl.collect_all(plans)).with_columns(pl.col('count').cast(pl.UInt32))
+
+
+class MapPyramid(dataset.IncrementalIndex):
+    '''
+    Piramide delle celle esagonali della mappa, per tutti i livelli di map_levels.
+    Alla costruzione la piramide viene letta da DATA/derived se è già stata salvata per la
+    versione del dataset, altrimenti viene calcolata e salvata.
+    Le nuove vendite vengono aggiunte ai conteggi delle celle senza ricalcolare la piramide
+    '''
+
+    def load(self, signature):
+        self.pyramid = dataset.derived(
+            ['map'],
+            signature,
+            lambda names: [_pyramid(dataset.scan_data(signature))]
+        )['map']
+        self.levels = self.pyramid.partition_by('level', as_dict=True, include_key=False)
+
+    def build(self, data):
+        self.pyramid = _pyramid(data)
+        self.levels = self.pyramid.partition_by('level', as_dict=True, include_key=False)
+
+    def update(self, rows):
+        self.pyramid = (
+            pl.concat([self.pyramid, _pyramid(rows)])
+            .group_by('level', 'q', 'r')
+            .agg(pl.col('lon', 'lat').first(), pl.col('count').sum())
+            .select(self.pyramid.columns)
+        )
+        self.levels = self.pyramid.partition_by('level', as_dict=True, include_key=False)
+
+    def level(self, level):
+        '''
+        PARAM
+            int: livello della piramide (chiave di map_levels)
+        RETURN
+            dataframe: celle del livello con 'lon', 'lat' del centro e 'count' numero di auto
+        '''
+        with self.lock:
+            cells = self.levels.get((level,))
+        if cells is None:
+            return pl.DataFrame(schema={'lon': pl.Float64, 'lat': pl.Float64, 'count': pl.UInt32})
+        return cells.select('lon', 'lat', 'count')
+
+
+@st.cache_resource(show_spinner=False)
+def _map_pyramid():
+    return MapPyramid()
+
+
+def map_pyramid():
+    '''
+    Funzione che ritorna la piramide della mappa, condivisa tra le sessioni
+
+    RETURN
+        MapPyramid: piramide aggiornata all'ultima versione del dataset
+    '''
+    return _map_pyramid().refresh()
@@ -0,0 +1,71 @@
+import streamlit as st
+import logging
+import threading
+import dataset
+import aggregates
+import indexes
+import spatial
+import dashboard
+
+'''
+Thread di precalcolo delle strutture derivate dal dataset.
+Quando cambia la versione del dataset (nuova vendita, compattazione) il thread aggiorna subito
+cubo aggregato, totali incrementali (compresi i conteggi dei grafici e i prezzi medi, letti in O(1)),
+statistiche dell'autonomia, piramide della mappa, indici della pagina di vendita e jitter strip plot.
+Ogni struttura viene sostituita in un colpo solo, quindi gli utenti trovano sempre le cache già pronte.
+'''
+
+# Intervallo in secondi tra due controlli della versione del dataset.
+# Le vendite fatte in questo processo svegliano il thread subito (dataset.data_changed),
+# il controllo periodico serve per le vendite fatte dagli altri processi
+poll_interval = 2
+
+logger = logging.getLogger(__name__)
+
+
+def warm():
+    '''
+    Funzione che aggiorna tutte le strutture derivate all'ultima versione del dataset
+
+    RETURN
+        tuple: firma del dataset con cui sono state aggiornate le strutture
+    '''
+    aggregates.cube()
+    totals = aggregates.running_totals()
+    totals.make_range_table()
+    spatial.map_pyramid()
+    indexes.city_bounds()
+    indexes.sale_lookup()
+    dashboard.jitter_strip_plot(totals.range_type_counts(), totals.signature)
+    return totals.signature
+
+
+def _run():
+    signature = None
+    # ultimo errore registrato, per non ripetere lo stesso traceback a ogni controllo
+    failed = None
+    while True:
+        dataset.data_changed.wait(poll_interval)
+        dataset.data_changed.clear()
+        try:
+            if dataset.data_signature() != signature:
+                signature = warm()
+                failed = None
+        except Exception as e:
+            # un errore non deve fermare il thread, si riprova al prossimo controllo
+            if repr(e) != failed:
+                logger.exception('Errore nel precalcolo delle strutture derivate')
+            failed = repr(e)
+
+
+@st.cache_resource(show_spinner=False)
+def start():
+    '''
+    Funzione che avvia il thread di precalcolo, una sola volta per processo
+
+    RETURN
+        thread: thread di precalcolo
+    '''
+    thread = threading.Thread(target=_run, name='warmup', daemon=True)
+    thread.start()
+    return thread